@@ -0,0 +1,94 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# Timing scripts for the training and decoding code paths, run on the real
+# dataset splits, read with corpus.load_corpora (no unzipping needed). Usage:
+#
+#   python benchmark.py [path/to/dataset.zip]
+################################################################################
+
+import sys
+import time
+import numpy as np
+from corpus import load_corpora
+from helpers import apply_smoothing, apply_smoothing_matrix, handle_unknown_words
+from models import HMM
+from sweep import format_results, sweep_beam_width, sweep_kbest
+
+TAGS = ["B-ORG", "I-ORG", "B-PER", "I-PER", "B-LOC", "I-LOC", "B-MISC", "I-MISC", "O"]
+
+
+def time_call(func, *args, repeat=3, **kwargs):
+    """
+    Returns the best wall-clock time over `repeat` calls of `func` and the result
+    of the last call.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def benchmark_smoothing(train_data, t=0.01, k=0.01):
+    """
+    Times `apply_smoothing` against `apply_smoothing_matrix` on the emission
+    counts of the training set and checks that both agree.
+    """
+    corpus, vocab = handle_unknown_words(t, train_data)
+    counts = np.zeros((len(corpus.tags), len(vocab)), dtype=int)
+    np.add.at(counts, (corpus.tag_ids, corpus.token_ids), 1)
+    count_dict = {
+        (tag, token): counts[i, j]
+        for i, tag in enumerate(corpus.tags)
+        for j, token in enumerate(vocab)
+    }
+
+    dict_time, expected = time_call(apply_smoothing, k, count_dict, vocab, repeat=1)
+    array_time, result = time_call(apply_smoothing_matrix, k, counts)
+    max_error = max(
+        abs(result[i, j] - expected[(tag, token)])
+        for i, tag in enumerate(corpus.tags)
+        for j, token in enumerate(vocab)
+    )
+    print(f"emission smoothing over {counts.shape[0]} x {counts.shape[1]} counts")
+    print(f"  apply_smoothing:        {dict_time * 1000:9.1f} ms")
+    print(f"  apply_smoothing_matrix: {array_time * 1000:9.1f} ms")
+    print(f"  speedup: {dict_time / array_time:.0f}x, max abs difference: {max_error:.3g}")
+
+
+def benchmark_beam(train_data, val_data, widths=(1, 2, 3, 4, 6, 9), t=0.01):
+    """
+    Prints the F1, agreement with exact Viterbi and throughput of beam search
+    decoding on the validation set for each beam width.
+    """
+    documents, vocab = handle_unknown_words(t, train_data)
+    model = HMM(
+        documents, train_data["NER"], vocab, train_data.tags, 0.01, 0.01, 0.1, apply_smoothing
+    )
+    print(f"beam search over {len(val_data['text'])} validation sentences")
+    print(format_results(sweep_beam_width(model, val_data, TAGS, widths)))
+
+
+def benchmark_kbest(train_data, val_data, ks=(1, 2, 5, 10, 20, 50), t=0.01):
+    """
+    Prints the throughput and oracle token accuracy of k-best decoding on the
+    validation set for each list size.
+    """
+    documents, vocab = handle_unknown_words(t, train_data)
+    model = HMM(
+        documents, train_data["NER"], vocab, train_data.tags, 0.01, 0.01, 0.1, apply_smoothing
+    )
+    print(f"k-best decoding over {len(val_data['text'])} validation sentences")
+    print(format_results(sweep_kbest(model, val_data, TAGS, ks)))
+
+
+if __name__ == "__main__":
+    data_zip_path = sys.argv[1] if len(sys.argv) > 1 else "dataset.zip"
+    train_data, val_data = load_corpora(
+        data_zip_path, splits=("train", "val"), drop_last_token=True
+    )
+    benchmark_smoothing(train_data)
+    benchmark_beam(train_data, val_data)
+    benchmark_kbest(train_data, val_data)
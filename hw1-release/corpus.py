@@ -0,0 +1,300 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# Flat, id-encoded representation of a dataset split. Instead of lists of lists
+# of strings, a Corpus keeps one array per field over all tokens plus sentence
+# offsets (CSR style), so sentence i is token_ids[offsets[i]:offsets[i + 1]].
+#
+# `load_corpora` reads the splits straight from dataset.zip and caches them in
+# this binary form, so later runs skip the JSON parsing. The notebook and
+# `data_exploration.load_dataset` keep their fixed unzip-and-read loading.
+################################################################################
+
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+import numpy as np
+from helpers import Vocabulary
+from models import decode_strings, encode_strings
+
+
+class Corpus:
+    """
+    A dataset split stored as flat arrays:
+
+      token_ids: np.ndarray[int32], id of every token under `vocab`
+      tag_ids: np.ndarray[uint8], id of every NER tag under `tags` (None for test data)
+      indices: np.ndarray[int64], dataset index of every token (None if not given)
+      offsets: np.ndarray[int64], sentence i spans offsets[i]:offsets[i + 1]
+
+    `corpus["text"]`, `corpus["NER"]` and `corpus["index"]` return read-only
+    per-sentence views that decode back to lists, so a Corpus can be used where a
+    `read_json` dictionary is expected. Slicing a Corpus returns a sub-corpus that
+    shares the underlying arrays.
+    """
+
+    def __init__(self, token_ids, offsets, vocab, tag_ids=None, tags=None, indices=None):
+        self.token_ids = token_ids
+        self.offsets = offsets
+        self.vocab = vocab
+        self.tag_ids = tag_ids
+        self.tags = tags
+        self.indices = indices
+
+    @classmethod
+    def from_dataset(cls, dataset, vocab=None, tags=None):
+        """
+        Returns the Corpus for a dataset dictionary as produced by `read_json`.
+
+        Input:
+          dataset: Dict<key String : value List[List[Any]]>, with key 'text' and
+            optionally 'NER' and 'index'
+          vocab: List[String] or Vocabulary, token ids to use. Tokens outside of it
+            are encoded as <unk>. Defaults to every token type in the dataset.
+          tags: List[String], tag ids to use. Defaults to the sorted NER tags.
+        Output:
+          corpus: Corpus
+        """
+        texts = dataset["text"]
+        lengths = np.fromiter((len(sentence) for sentence in texts), dtype=np.int64, count=len(texts))
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tokens = [token for sentence in texts for token in sentence]
+
+        if vocab is None:
+            vocab = sorted(set(tokens))
+        if not isinstance(vocab, Vocabulary):
+            vocab = Vocabulary(vocab)
+        token_ids = vocab.encode(tokens).astype(np.int32)
+
+        tag_ids = None
+        if "NER" in dataset:
+            labels = [tag for sentence in dataset["NER"] for tag in sentence]
+            if tags is None:
+                tags = sorted(set(labels))
+            if len(tags) > np.iinfo(np.uint8).max + 1:
+                raise ValueError("Corpus supports at most 256 distinct tags")
+            tag_to_id = {tag: i for i, tag in enumerate(tags)}
+            tag_ids = np.fromiter((tag_to_id[tag] for tag in labels), dtype=np.uint8, count=len(labels))
+
+        indices = None
+        if "index" in dataset:
+            indices = np.fromiter(
+                (index for sentence in dataset["index"] for index in sentence),
+                dtype=np.int64,
+                count=offsets[-1],
+            )
+        return cls(token_ids, offsets, vocab, tag_ids, tags, indices)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def sentence(self, i):
+        """
+        Returns the token ids of sentence `i` as a view into `token_ids`.
+        """
+        return self.token_ids[self.offsets[i] : self.offsets[i + 1]]
+
+    def sentence_tags(self, i):
+        """
+        Returns the tag ids of sentence `i` as a view into `tag_ids`.
+        """
+        return self.tag_ids[self.offsets[i] : self.offsets[i + 1]]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("Corpus slices must be contiguous")
+            stop = max(start, stop)
+            lo, hi = self.offsets[start], self.offsets[stop]
+            return Corpus(
+                self.token_ids[lo:hi],
+                self.offsets[start : stop + 1] - lo,
+                self.vocab,
+                None if self.tag_ids is None else self.tag_ids[lo:hi],
+                self.tags,
+                None if self.indices is None else self.indices[lo:hi],
+            )
+        if key == "text":
+            return _Column(self, self.token_ids, self.vocab)
+        if key == "NER" and self.tag_ids is not None:
+            return _Column(self, self.tag_ids, self.tags)
+        if key == "index" and self.indices is not None:
+            return _Column(self, self.indices)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def drop_last_token(self):
+        """
+        Returns the corpus with the last token (and its tag and index) of every
+        sentence dropped, the notebook's preprocessing, done on the flat arrays.
+        Empty sentences stay empty.
+        """
+        lengths = np.maximum(self.lengths - 1, 0)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        keep = np.ones(len(self.token_ids), dtype=bool)
+        keep[self.offsets[1:][self.lengths > 0] - 1] = False
+        return Corpus(
+            self.token_ids[keep], offsets, self.vocab,
+            None if self.tag_ids is None else self.tag_ids[keep],
+            self.tags,
+            None if self.indices is None else self.indices[keep],
+        )
+
+    def remap(self, id_map, vocab):
+        """
+        Returns a Corpus over `vocab` whose token ids are `id_map[token_ids]`,
+        sharing every other array with this one.
+        """
+        token_ids = np.asarray(id_map)[self.token_ids].astype(np.int32)
+        return Corpus(token_ids, self.offsets, vocab, self.tag_ids, self.tags, self.indices)
+
+    def to_dataset(self):
+        """
+        Returns the corpus as a `read_json`-style dictionary of lists.
+        """
+        return {key: list(self[key]) for key in ("index", "text", "NER") if key in self}
+
+    def save(self, path):
+        """
+        Saves the corpus arrays, vocabulary and tags to a NumPy archive at `path`.
+        """
+        arrays = {"token_ids": self.token_ids, "offsets": self.offsets}
+        arrays["vocab"], arrays["vocab_offsets"] = encode_strings(self.vocab)
+        if self.tag_ids is not None:
+            arrays["tag_ids"] = self.tag_ids
+            arrays["tags"], arrays["tag_offsets"] = encode_strings(self.tags)
+        if self.indices is not None:
+            arrays["indices"] = self.indices
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads a corpus written by `save`.
+        """
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        vocab = Vocabulary(decode_strings(arrays["vocab"], arrays["vocab_offsets"]))
+        tags = None
+        if "tags" in arrays:
+            tags = decode_strings(arrays["tags"], arrays["tag_offsets"])
+        return cls(
+            arrays["token_ids"], arrays["offsets"], vocab,
+            arrays.get("tag_ids"), tags, arrays.get("indices"),
+        )
+
+
+def read_json_from_zip(zip_filepath, filename):
+    """
+    Reads a JSON file straight out of a zip file, without extracting anything.
+    The file is looked up by its base name, so "train.json" finds
+    "dataset/train.json"; the macOS metadata under "__MACOSX/" is skipped.
+
+    Input:
+      zip_filepath: String, path to the zip file
+      filename: String, base name of the JSON file in the zip file
+    Output:
+      result: Dict, representing the contents of the JSON file
+    """
+    with zipfile.ZipFile(zip_filepath, "r") as zip_ref:
+        for name in zip_ref.namelist():
+            if not name.startswith("__MACOSX/") and os.path.basename(name) == filename:
+                return json.loads(zip_ref.read(name))
+    raise FileNotFoundError(f"{filename} not found in {zip_filepath}")
+
+
+def file_hash(path):
+    """
+    Returns the SHA-256 hex digest of the file at `path`.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_corpora(data_zip_path, cache_dir=None, splits=("train", "val", "test"), drop_last_token=False):
+    """
+    Returns the given splits of the dataset zip file as Corpus objects. The first
+    call parses the JSON files straight from the zip file, without extracting
+    it, and writes each split to a binary cache keyed by the hash of the zip
+    file; later calls only read the cache. A changed zip file gets a new cache.
+
+    The cache holds the splits as stored; `drop_last_token` applies the
+    notebook's preprocessing (dropping the trailing token of each sentence) to
+    the loaded arrays (see `Corpus.drop_last_token`).
+
+    Input:
+      data_zip_path: String, path to dataset.zip
+      cache_dir: String, directory of the cache. Defaults to ".corpus_cache" next
+        to the zip file.
+      splits: Tuple[String], names of the JSON files in the zip file, without '.json'
+      drop_last_token: Boolean, whether to drop the last token of every sentence
+    Output:
+      corpora: Tuple[Corpus], one per split
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(data_zip_path)), ".corpus_cache")
+    split_dir = os.path.join(cache_dir, file_hash(data_zip_path))
+    os.makedirs(split_dir, exist_ok=True)
+
+    corpora = []
+    for name in splits:
+        path = os.path.join(split_dir, name + ".npz")
+        if not os.path.exists(path):
+            corpus = Corpus.from_dataset(read_json_from_zip(data_zip_path, name + ".json"))
+            # written to a temporary file first, so an interrupted run leaves no
+            # partial cache behind
+            fd, temp_path = tempfile.mkstemp(dir=split_dir, suffix=".npz")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    corpus.save(f)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        corpus = Corpus.load(path)
+        corpora.append(corpus.drop_last_token() if drop_last_token else corpus)
+    return tuple(corpora)
+
+
+class _Column:
+    """
+    Per-sentence view of one flat corpus array. Items are decoded to Python lists,
+    through `names` when given (token or tag strings).
+    """
+
+    def __init__(self, corpus, values, names=None):
+        self.corpus = corpus
+        self.values = values
+        self.names = names
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        ids = self.values[self.corpus.offsets[i] : self.corpus.offsets[i + 1]]
+        if self.names is None:
+            return ids.tolist()
+        return [self.names[j] for j in ids]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
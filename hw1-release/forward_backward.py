@@ -0,0 +1,109 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# Log-space forward-backward over the HMM parameter tables, batched across
+# sentences like `viterbi_batch`. Gives per-token posterior tag marginals
+# P(tag_i = j | sentence) and sequence log-likelihoods log P(sentence), e.g. as
+# confidence scores for the Viterbi predictions.
+################################################################################
+
+import numpy as np
+from viterbi import decoding_batches, encode_corpus, get_decoding_tables
+
+
+def logsumexp(scores, axis):
+    """
+    Returns log(sum(exp(scores))) along `axis`, computed stably; slices that are
+    all -inf give -inf.
+    """
+    peak = np.max(scores, axis=axis, keepdims=True)
+    peak = np.where(np.isfinite(peak), peak, 0.0)
+    with np.errstate(divide="ignore"):
+        total = np.log(np.sum(np.exp(scores - peak), axis=axis, keepdims=True))
+    return np.squeeze(total + peak, axis=axis)
+
+
+def _log_matmul(scores, probs):
+    """
+    Returns log(exp(scores) @ probs) for a (B, K) log-space matrix and a (K, K)
+    matrix of probabilities. Each row is shifted by its maximum before
+    exponentiating, so the product stays in range and the sum over K runs as a
+    matrix product instead of a (B, K, K) log-sum-exp.
+    """
+    peak = np.max(scores, axis=1, keepdims=True)
+    peak = np.where(np.isfinite(peak), peak, 0.0)
+    with np.errstate(divide="ignore"):
+        return np.log(np.exp(scores - peak) @ probs) + peak
+
+
+def forward_backward_batch(model, observations, tags, batch_size=256):
+    """
+    Returns the posterior tag marginals of every token and the log-likelihood of
+    every observation under the model, running the forward and backward
+    recursions for `batch_size` sentences at a time. The sums over the previous
+    (or next) tag are log-sum-exps done as max-shifted (B, K) x (K, K) matrix
+    products, so this costs about as much as a `viterbi_batch` pass. The end of
+    every sentence includes the transition into 'qf'.
+
+    Input:
+      model: HMM model
+      observations: List[List[String]], List[np.ndarray] of token ids or corpus.Corpus
+      tags: List[String]
+      batch_size: Int, number of sentences processed together
+    Output:
+      posteriors: List[np.ndarray], of shape (N, K) per observation, where
+        [i, j] = P(tag_i = tags[j] | observation) over `tags` without 'qf'
+      log_likelihoods: np.ndarray of shape (len(observations),), log P(observation)
+        (0 for empty observations)
+    """
+    if hasattr(observations, "offsets"):
+        observations = encode_corpus(model, observations)
+    real_tags, start, transition, final, emission = get_decoding_tables(model, tags)
+    K = len(real_tags)
+    transition_probs = np.exp(transition)
+    posteriors = [np.zeros((0, K)) for _ in observations]
+    log_likelihoods = np.zeros(len(observations))
+
+    for batch, lengths, emissions, _ in decoding_batches(model, observations, emission, batch_size):
+        B, N = len(batch), lengths.max()
+
+        # alpha[:, i, j] = log P(tokens 0..i, tag_i = j)
+        alpha = np.empty((B, N, K))
+        alpha[:, 0] = start[None, :] + emissions[:, 0]
+        for i in range(1, N):
+            alpha[:, i] = _log_matmul(alpha[:, i - 1], transition_probs) + emissions[:, i]
+
+        # beta[:, i, k] = log P(tokens i+1..end, qf | tag_i = k); every sentence
+        # starts from `final` at its own last token
+        beta = np.empty((B, N, K))
+        beta[:, N - 1] = final[None, :]
+        for i in range(N - 2, -1, -1):
+            step = _log_matmul(emissions[:, i + 1] + beta[:, i + 1], transition_probs.T)
+            beta[:, i] = np.where((i + 1 < lengths)[:, None], step, final[None, :])
+
+        rows = np.arange(B)
+        totals = logsumexp(alpha[rows, lengths - 1] + final[None, :], axis=1)
+        with np.errstate(invalid="ignore"):
+            marginals = np.exp(alpha + beta - totals[:, None, None])
+        for row, b in enumerate(batch):
+            posteriors[b] = marginals[row, : lengths[row]]
+            log_likelihoods[b] = totals[row]
+
+    return posteriors, log_likelihoods
+
+
+def forward_backward(model, observation, tags):
+    """
+    Returns the (N, K) posterior tag marginals and the log-likelihood of one
+    observation; see `forward_backward_batch`.
+
+    Input:
+      model: HMM model
+      observation: List[String] or np.ndarray of token ids
+      tags: List[String]
+    Output:
+      posterior: np.ndarray of shape (N, K)
+      log_likelihood: Float
+    """
+    posteriors, log_likelihoods = forward_backward_batch(model, [observation], tags)
+    return posteriors[0], log_likelihoods[0]
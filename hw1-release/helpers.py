@@ -11,6 +11,93 @@ import numpy as np
 from collections import Counter, defaultdict
 
 
+class Vocabulary(list):
+    """
+    List of vocabulary tokens with O(1) membership and a stable token <-> id
+    mapping, where a token's id is its position in the list. The <unk> token is
+    always part of the vocabulary.
+
+    It behaves like the plain `List[String]` vocab everywhere else in the code,
+    so it can be passed to `HMM` directly. It only grows: new tokens are added
+    through `add` (or `append`/`extend`/`+=`), and the list methods that would
+    replace, remove or reorder tokens raise TypeError, since ids are positions.
+
+    Example:
+    vocab = Vocabulary(["apple", "banana", "<unk>"])
+    vocab.encode(["banana", "kiwi"])
+    # array([1, 2])
+    """
+
+    UNK = "<unk>"
+
+    def __init__(self, tokens=()):
+        super().__init__()
+        self.token_to_id = {}
+        self.extend(tokens)
+        self.unk_id = self.add(self.UNK)
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    def __contains__(self, token):
+        return token in self.token_to_id
+
+    def add(self, token):
+        """
+        Adds `token` if it is not already in the vocabulary and returns its id.
+        """
+        token_id = self.token_to_id.get(token)
+        if token_id is None:
+            token_id = len(self)
+            self.token_to_id[token] = token_id
+            super().append(token)
+        return token_id
+
+    def append(self, token):
+        self.add(token)
+
+    def extend(self, tokens):
+        for token in tokens:
+            self.add(token)
+
+    def __iadd__(self, tokens):
+        self.extend(tokens)
+        return self
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Vocabulary only supports adding tokens; ids are list positions")
+
+    insert = pop = remove = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __imul__ = _read_only
+
+    def index(self, token, start=0, stop=None):
+        """
+        Returns the id of `token`, raising ValueError like `list.index` if it is
+        not in the vocabulary (between `start` and `stop`).
+        """
+        token_id = self.token_to_id.get(token)
+        if token_id is None or token_id not in range(len(self))[start:stop]:
+            raise ValueError(f"{token!r} is not in vocabulary")
+        return token_id
+
+    def encode(self, document):
+        """
+        Returns the ids of the tokens in `document`, with tokens outside the
+        vocabulary mapped to the <unk> id.
+
+        Input:
+            document (list): A list of tokens.
+        Output:
+            token_ids (np.ndarray): An int64 array of shape (len(document),).
+        """
+        lookup = self.token_to_id.get
+        return np.fromiter(
+            (lookup(token, self.unk_id) for token in document),
+            dtype=np.int64,
+            count=len(document),
+        )
+
+
 def handle_unknown_words(t, documents):
     """
     Replaces tokens in the given documents with <unk> (unknown) tokens if they occur
@@ -22,13 +109,16 @@ def handle_unknown_words(t, documents):
         t (float):
             A value between 0 and 1 representing the threshold for token frequency.
             The int(t * total_unique_tokens) least frequent tokens will be replaced.
-        documents (list of lists):
+        documents (list of lists, corpus.Corpus or streaming.SentenceStream):
             A list of documents, where each document is represented as a list of tokens.
     Output:
-        new_documents (list of lists):
+        new_documents (list of lists, corpus.Corpus or streaming.SentenceStream):
             A list of processed documents where the int(t * total_unique_tokens) least
             frequent tokens have been replaced with <unk> tokens and no other changes.
-        vocab (list):
+            A Corpus input gives a Corpus over the returned vocab; a stream input gives
+            the stream with the replacement applied as it is read, so only the token
+            frequencies are held in memory.
+        vocab (Vocabulary):
             A list of tokens representing the vocabulary, including both the most common tokens
             and the <unk> token.
     Example:
@@ -44,35 +134,191 @@ def handle_unknown_words(t, documents):
     # vocab: ['banana', 'apple', 'cherry', '<unk>']
     """
     # YOUR CODE HERE
-    # flatten documents and obtain frequencies of tokens
-    counts = [Counter(document) for document in documents]
-    frequencies = Counter()
-    for count in counts:
-        frequencies += count
-    # unique tokens
-    total_unique_tokens = len(frequencies)
-    # find threshold for tokens to replace
-    threshold = max(1, int(t * total_unique_tokens))
-    # sort tokens by frequency then alphabetically
-    sorted_tokens = sorted(frequencies, key=lambda token: (frequencies[token], token))
-    # identify tokens we need to replace
-    tokens_to_replace = set(sorted_tokens[:threshold])
+    if hasattr(documents, "token_ids"):
+        return _handle_unknown_words_corpus(t, documents)
+    if hasattr(documents, "chunks"):
+        # only the vocabulary is needed; every token outside it is a replaced one
+        _, vocab = handle_unknown_words_stream(t, documents["text"])
+        return documents.with_vocab(vocab), vocab
+
+    new_documents, vocab = handle_unknown_words_stream(t, documents)
+    return list(new_documents), vocab
+
+
+def handle_unknown_words_stream(t, documents):
+    """
+    Streaming version of `handle_unknown_words` with the same replacement and
+    ordering rules. Token frequencies are counted in a single pass, the replaced
+    tokens are picked by partial selection instead of sorting every type, and the
+    processed documents are produced lazily.
+
+    Input:
+        t (float):
+            A value between 0 and 1 representing the threshold for token frequency.
+        documents (iterable of lists):
+            Any iterable of documents. A re-iterable collection (e.g. a list) is
+            read a second time while the output is consumed; a one-shot iterator
+            such as a generator is buffered during the counting pass.
+    Output:
+        new_documents (generator of lists):
+            The processed documents, in input order.
+        vocab (Vocabulary):
+            The remaining tokens and the <unk> token, sorted.
+    """
+    if iter(documents) is documents:
+        buffered = []
+        frequencies = Counter()
+        for document in documents:
+            document = list(document)
+            frequencies.update(document)
+            buffered.append(document)
+        documents = buffered
+    else:
+        frequencies = Counter()
+        for document in documents:
+            frequencies.update(document)
+
+    threshold = max(1, int(t * len(frequencies)))
+    tokens_to_replace = _least_frequent(frequencies, threshold)
 
     UNK_TOKEN = "<unk>"
+    kept = [token for token in frequencies if token not in tokens_to_replace]
+    if tokens_to_replace:
+        kept.append(UNK_TOKEN)
+    vocab = Vocabulary(sorted(set(kept)))
+
+    new_documents = (
+        [UNK_TOKEN if token in tokens_to_replace else token for token in document]
+        for document in documents
+    )
+    return new_documents, vocab
+
+
+def _least_frequent(frequencies, n):
+    """
+    Returns the set of the `n` tokens that come first when ordered by frequency
+    then alphabetically, without sorting every token: a histogram of the
+    frequencies locates the cutoff frequency, and only the tokens at exactly that
+    frequency are sorted.
+    """
+    histogram = Counter(frequencies.values())
+    selected_below, cutoff = 0, None
+    for frequency in sorted(histogram):
+        if selected_below + histogram[frequency] >= n:
+            cutoff = frequency
+            break
+        selected_below += histogram[frequency]
+    if cutoff is None:
+        return set(frequencies)
+
+    chosen = {token for token, count in frequencies.items() if count < cutoff}
+    at_cutoff = sorted(token for token, count in frequencies.items() if count == cutoff)
+    chosen.update(at_cutoff[: n - selected_below])
+    return chosen
+
+
+class FrequencyRanks:
+    """
+    The order in which `handle_unknown_words` replaces token types (frequency
+    first, then alphabetically), computed once over a training corpus. Any
+    threshold `t` then becomes a cutoff into this order, so trying several
+    thresholds needs neither recounting nor re-sorting.
 
-    # Replace tokens in documents
-    new_documents = []
-    for document in documents:
-        new_doc = [
-            UNK_TOKEN if token in tokens_to_replace else token for token in document
+    Together with `HMM.with_vocab`, a model trained once over the full vocabulary
+    can be re-derived for every threshold:
+
+    ranks = FrequencyRanks(training_data["text"])
+    base = HMM(training_data["text"], training_data["NER"], ranks.full_vocab(), ...)
+    for t in [0.005, 0.01, 0.02]:
+        model = base.with_vocab(ranks.vocab(t))
+    """
+
+    def __init__(self, documents):
+        """
+        Input:
+            documents (iterable of lists or corpus.Corpus):
+                The training documents.
+        """
+        if hasattr(documents, "token_ids"):
+            counts = np.bincount(documents.token_ids, minlength=len(documents.vocab))
+            frequencies = {documents.vocab[i]: counts[i] for i in np.flatnonzero(counts)}
+        else:
+            frequencies = Counter()
+            for document in documents:
+                frequencies.update(document)
+
+        self.tokens = sorted(frequencies, key=lambda token: (frequencies[token], token))
+        self.frequencies = np.array([frequencies[token] for token in self.tokens], dtype=np.int64)
+        self.rank = {token: i for i, token in enumerate(self.tokens)}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def cutoff(self, t):
+        """
+        Returns the number of tokens `handle_unknown_words` replaces for `t`.
+        """
+        return max(1, int(t * len(self.tokens)))
+
+    def replaced(self, t):
+        """
+        Returns the set of tokens replaced with <unk> for threshold `t`.
+        """
+        return set(self.tokens[: self.cutoff(t)])
+
+    def vocab(self, t):
+        """
+        Returns the vocabulary `handle_unknown_words(t, documents)` would return.
+        """
+        return Vocabulary(sorted(set(self.tokens[self.cutoff(t) :]) | {"<unk>"}))
+
+    def full_vocab(self):
+        """
+        Returns a vocabulary with every token type plus <unk>, for training the
+        model that `HMM.with_vocab` derives the per-threshold models from.
+        """
+        return Vocabulary(sorted(set(self.tokens) | {"<unk>"}))
+
+    def replace(self, t, documents):
+        """
+        Returns the same output as `handle_unknown_words(t, documents)` for the
+        documents these ranks were computed from.
+        """
+        cutoff = self.cutoff(t)
+        rank = self.rank
+        new_documents = [
+            ["<unk>" if rank.get(token, cutoff) < cutoff else token for token in document]
+            for document in documents
         ]
-        new_documents.append(new_doc)
+        return new_documents, self.vocab(t)
 
-    # Construct vocabulary (all remaining tokens + <unk>)
-    vocab = sorted(set(token for doc in new_documents for token in doc))
 
-    return new_documents, vocab
+def _handle_unknown_words_corpus(t, corpus):
+    """
+    `handle_unknown_words` for a corpus.Corpus: token frequencies come from one
+    bincount over the flat token ids, and the replacement is a single id remap.
+    """
+    frequencies = np.bincount(corpus.token_ids, minlength=len(corpus.vocab))
+    present = np.flatnonzero(frequencies)
+    threshold = max(1, int(t * len(present)))
+
+    # sort present types by frequency then alphabetically
+    names = np.array([corpus.vocab[i] for i in present], dtype=str)
+    order = present[np.lexsort((names, frequencies[present]))]
+    replaced = np.zeros(len(corpus.vocab), dtype=bool)
+    replaced[order[:threshold]] = True
 
+    kept = [corpus.vocab[i] for i in present if not replaced[i]]
+    if replaced.any():
+        kept.append("<unk>")
+    vocab = Vocabulary(sorted(set(kept)))
+
+    id_map = np.array(
+        [vocab.unk_id if replaced[i] else vocab.token_to_id.get(token, vocab.unk_id)
+         for i, token in enumerate(corpus.vocab)],
+        dtype=np.int64,
+    )
+    return corpus.remap(id_map, vocab), vocab
 
 # Test Case 1: Basic Example
 documents_1 = [
@@ -184,3 +430,83 @@ def apply_smoothing(k, observation_counts, unique_obs):
             
             log_prob[(state, obs)] = np.log(num) - np.log(denom)
     return log_prob
+
+
+def apply_smoothing_matrix(k, counts, states=None, unique_obs=None, as_dict=False):
+    """
+    Array version of `apply_smoothing`: applies add-k smoothing to a whole matrix
+    of state-observation counts at once and returns the log smoothed observation
+    probabilities log[P(observation | state)].
+
+    Each row's denominator is accumulated left to right like the `sum` in
+    `apply_smoothing`, so with the columns in `unique_obs` order the results are
+    identical to it, not just close.
+
+    Input:
+        k (float):
+            A float number to add to each count (the k in add-k smoothing)
+        counts (np.ndarray or scipy.sparse matrix of shape (S, O)):
+            counts[i, j] is the number of occurrences of (states[i], unique_obs[j]).
+        states (List[str]):
+            Row labels, only needed when `as_dict` is True.
+        unique_obs (List[str]):
+            Column labels, only needed when `as_dict` is True.
+        as_dict (bool):
+            Return the `apply_smoothing` dictionary format instead of an array.
+
+    Output:
+        np.ndarray of shape (S, O), or Dict<key Tuple[String, String]: value Float>
+    """
+    if hasattr(counts, "toarray"):
+        counts = counts.toarray()
+    smoothed = np.asarray(counts, dtype=np.float64) + k
+    if smoothed.shape[1] == 0:
+        log_prob = smoothed
+    else:
+        denom = np.cumsum(smoothed, axis=1)[:, -1:]
+        log_prob = np.log(smoothed) - np.log(denom)
+
+    if not as_dict:
+        return log_prob
+    rows = log_prob.tolist()
+    return {
+        (state, obs): rows[i][j]
+        for i, state in enumerate(states)
+        for j, obs in enumerate(unique_obs)
+    }
+
+
+def apply_smoothing_sparse(k, keys, counts, num_states, num_obs):
+    """
+    Sparse version of `apply_smoothing_matrix` for a (num_states, num_obs) count
+    matrix given by its non-zero entries only. With add-k smoothing every unseen
+    (state, observation) pair of a state gets the same log probability, so the
+    result is one value per observed pair plus one default per state.
+
+    Input:
+        k (float):
+            A float number to add to each count (the k in add-k smoothing)
+        keys (np.ndarray of int):
+            Observed pairs, encoded as observation * num_states + state.
+        counts (np.ndarray):
+            Number of occurrences of each pair in `keys`.
+        num_states (int), num_obs (int):
+            Shape of the full count matrix.
+
+    Output:
+        values (np.ndarray):
+            Log smoothed probability of each pair in `keys`.
+        default (np.ndarray of shape (num_states,)):
+            Log smoothed probability of any unseen pair of each state.
+    """
+    states = keys % num_states
+    totals = np.bincount(states, weights=counts, minlength=num_states)
+    log_denom = np.log(totals + k * num_obs)
+    values = np.log(counts + k) - log_denom[states]
+    default = np.log(k) - log_denom
+    return values, default
+
+
+# lets HMM smooth its count tables without going through the dictionary format
+apply_smoothing.matrix_version = apply_smoothing_matrix
+apply_smoothing.sparse_version = apply_smoothing_sparse
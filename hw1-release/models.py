@@ -17,23 +17,33 @@ import numpy as np
 class HMM:
 
     def __init__(
-        self, documents, labels, vocab, all_tags, k_t, k_e, k_s, smoothing_func
+        self, documents, labels, vocab, all_tags, k_t, k_e, k_s, smoothing_func,
+        sparse_emissions=False,
     ):
         """
         Initializes HMM based on the following properties.
 
         Input:
-          documents: List[List[String]], dataset of sentences to train model
-          labels: List[List[String]], NER labels corresponding the sentences to train model
-          vocab: List[String], dataset vocabulary
+          documents: List[List[String]], corpus.Corpus or streaming.SentenceStream, dataset of
+          sentences to train model
+          labels: List[List[String]], corpus.Corpus or streaming.SentenceStream, NER labels
+          corresponding the sentences to train model. A stream is counted chunk by chunk from
+          its own 'NER' column, so pass the same stream as documents and labels.
+          vocab: List[String] or helpers.Vocabulary, dataset vocabulary
           all_tags: List[String], all possible NER tags
           k_t: Float, add-k parameter to smooth transition probabilities
           k_e: Float, add-k parameter to smooth emission probabilities
           k_s: Float, add-k parameter to smooth starting state probabilities
           smoothing_func: (Float, Dict<key Tuple[String, String] : value Float>, List[String]) ->
           Dict<key Tuple[String, String] : value Float>
+          sparse_emissions: Boolean, store emission counts and probabilities only for
+          observed (tag, token) pairs plus one default per tag (see `SparseEmissions`).
+          Needs a smoothing function with a `sparse_version`, like helpers.apply_smoothing.
         """
         self.documents = documents
+        if hasattr(labels, "tag_ids"):
+            # a corpus.Corpus; its 'NER' view yields the label lists
+            labels = labels["NER"]
         self.labels = labels
         self.vocab = vocab
         self.all_tags = all_tags
@@ -41,9 +51,722 @@ class HMM:
         self.k_e = k_e
         self.k_s = k_s
         self.smoothing_func = smoothing_func
-        self.emission_matrix = self.build_emission_matrix()
-        self.transition_matrix = self.build_transition_matrix()
-        self.start_state_probs = self.get_start_state_probs()
+        self.sparse_emissions = sparse_emissions
+        if sparse_emissions and not hasattr(smoothing_func, "sparse_version"):
+            raise ValueError("sparse_emissions needs a smoothing_func with a sparse_version")
+
+        self._set_ids()
+
+        # count everything once, then only smoothing is left
+        self.count_statistics()
+        self._build_tables()
+
+    def _set_ids(self):
+        """
+        Sets up the integer ids of the tags and tokens for the dense parameter
+        tables. Rows are the real tags (everything but 'qf'); transition columns
+        additionally end with 'qf'.
+        """
+        self.tag_to_id = {
+            tag: i for i, tag in enumerate(dict.fromkeys(t for t in self.all_tags if t != "qf"))
+        }
+        self.next_tag_to_id = dict(self.tag_to_id)
+        self.next_tag_to_id["qf"] = len(self.tag_to_id)
+        if isinstance(self.vocab, TokenTable):
+            # read-only and already indexed (see `from_arrays`)
+            self.token_to_id = self.vocab
+        elif hasattr(self.vocab, "token_to_id"):
+            # a helpers.Vocabulary already carries its id map
+            self.token_to_id = dict(self.vocab.token_to_id)
+        else:
+            self.token_to_id = {token: i for i, token in enumerate(dict.fromkeys(self.vocab))}
+        self.unk_id = self.token_to_id.get("<unk>")
+        # column orders used by `_smooth`, by count table, for these ids
+        self._column_orders = {}
+
+    def _build_tables(self):
+        """
+        Smooths the count tables into the parameter tables and sets up the
+        dictionary views over them.
+        """
+        self._set_tables(
+            self._smooth_emissions(), self._smooth_transitions(), self._smooth_starts()
+        )
+
+    def _set_tables(self, emission, transition, start):
+        """
+        Installs the given log probability tables and the dictionary views over them.
+        """
+        # K x V emission, K x (K+1) transition and K start log probabilities.
+        # `partial_fit` marks rows stale; they are re-smoothed on next access.
+        self._emission_log_probs = emission
+        self._transition_log_probs = transition
+        self._start_log_probs = start
+        self._stale_emission_rows = set()
+        self._stale_transition_rows = set()
+        self._stale_starts = False
+        self._fingerprint = None
+
+        # the dictionaries the rest of the code expects, backed by the tables above
+        self.emission_matrix = ParameterView(
+            self, "emission_log_probs", self.tag_to_id, self.token_to_id
+        )
+        self.transition_matrix = ParameterView(
+            self, "transition_log_probs", self.tag_to_id, self.next_tag_to_id
+        )
+        self.start_state_probs = ParameterView(self, "start_log_probs", self.tag_to_id)
+
+    @property
+    def emission_log_probs(self):
+        if self._stale_emission_rows:
+            rows = sorted(self._stale_emission_rows)
+            if self.sparse_emissions:
+                self._emission_log_probs = self._smooth_emissions(rows)
+            else:
+                self._emission_log_probs[rows] = self._smooth_emissions(rows)
+            self._stale_emission_rows.clear()
+        return self._emission_log_probs
+
+    @property
+    def transition_log_probs(self):
+        if self._stale_transition_rows:
+            rows = sorted(self._stale_transition_rows)
+            self._transition_log_probs[rows] = self._smooth_transitions(rows)
+            self._stale_transition_rows.clear()
+        return self._transition_log_probs
+
+    @property
+    def start_log_probs(self):
+        if self._stale_starts:
+            self._start_log_probs = self._smooth_starts()
+            self._stale_starts = False
+        return self._start_log_probs
+
+    def partial_fit(self, documents, labels, grow_vocab=False):
+        """
+        Folds new labeled sentences into the model without recounting the
+        training data. Their counts are added to the count tables and only the
+        parameter rows they touch are marked stale; those rows are re-smoothed the
+        next time the parameters are read (by `get_tag_likelihood`, the decoders or
+        the dictionary views). Counting costs time proportional to the update, but
+        a touched row's normaliser changes every entry of it, so the refresh is not:
+        each stale dense emission row is re-smoothed over all V columns, and the
+        sparse table is rebuilt with a few array passes over all observed pairs
+        (only the stale rows' values are recomputed, nothing is re-sorted).
+
+        With `grow_vocab`, tokens that are not in the vocabulary yet are added to
+        it instead of being counted as <unk>. Since that changes the normaliser of
+        every emission row, all emission rows are re-smoothed in that case.
+
+        Note: `documents` and `labels` keep referring to the original training data;
+        the count tables are what include the updates.
+
+        Input:
+          documents: List[List[String]], corpus.Corpus or streaming.SentenceStream, new sentences
+          labels: List[List[String]], corpus.Corpus or streaming.SentenceStream, NER labels
+          of the new sentences
+          grow_vocab: Boolean, whether to add unseen tokens to the vocabulary
+        """
+        if hasattr(documents, "chunks"):
+            # a streaming.SentenceStream, folded in one chunk at a time
+            for chunk in documents.chunks():
+                self.partial_fit(chunk["text"], chunk["NER"], grow_vocab)
+            return
+        if hasattr(labels, "tag_ids"):
+            labels = labels["NER"]
+        if grow_vocab:
+            self._grow_vocab(documents)
+
+        emission_pairs, transition_pairs, starts, num_sequences = self._count_pairs(
+            documents, labels
+        )
+        K, V = self.emission_counts.shape
+        if self.sparse_emissions:
+            self.emission_counts.add(emission_pairs % V * K + emission_pairs // V)
+        else:
+            cells, increments = np.unique(emission_pairs, return_counts=True)
+            self.emission_counts.reshape(-1)[cells] += increments
+        self._stale_emission_rows.update(np.unique(emission_pairs // V).tolist())
+
+        cells, increments = np.unique(transition_pairs, return_counts=True)
+        self.transition_counts.reshape(-1)[cells] += increments
+        self._stale_transition_rows.update((cells // (K + 1)).tolist())
+        self.start_counts += np.bincount(starts, minlength=K)
+        self.num_sequences += num_sequences
+        self._stale_starts = True
+        self._fingerprint = None
+
+    def with_smoothing(self, k_t, k_e, k_s):
+        """
+        Returns a copy of this model re-smoothed with new add-k parameters. The
+        count tables are reused instead of recounting the training data, so this
+        costs one pass of `smoothing_func` over the tables.
+
+        Input:
+          k_t: Float, add-k parameter to smooth transition probabilities
+          k_e: Float, add-k parameter to smooth emission probabilities
+          k_s: Float, add-k parameter to smooth starting state probabilities
+        Output:
+          model: HMM
+        """
+        model = self._copy_counts()
+        model.k_t, model.k_e, model.k_s = k_t, k_e, k_s
+        model._build_tables()
+        return model
+
+    def with_vocab(self, vocab):
+        """
+        Returns a copy of this model over `vocab`, as if it had been trained on
+        documents where every token outside `vocab` was replaced with <unk>. The
+        emission counts of those tokens are folded into the <unk> column instead of
+        recounting the training data, so a model trained once over the full
+        vocabulary can be re-derived cheaply for every `handle_unknown_words`
+        threshold (see helpers.FrequencyRanks).
+
+        Input:
+          vocab: List[String] or helpers.Vocabulary, must contain <unk> if any token
+            of the current vocabulary is left out
+        Output:
+          model: HMM
+        """
+        model = self._copy_counts()
+        model.vocab = vocab
+        model._set_ids()
+
+        # new column of every current token; dropped tokens go to <unk>, or
+        # disappear if the new vocabulary has none
+        unk_id = -1 if model.unk_id is None else model.unk_id
+        column_map = np.array(
+            [model.token_to_id.get(token, unk_id) for token in self.token_to_id], dtype=int
+        )
+        K, V = len(self.tag_to_id), len(model.token_to_id)
+        if self.sparse_emissions:
+            counts = self.emission_counts
+            tags, tokens = counts.keys % K, column_map[counts.keys // K]
+            keep = tokens >= 0
+            model.emission_counts = PairCounts((K, V))
+            model.emission_counts.add(tokens[keep] * K + tags[keep], counts.counts[keep])
+        else:
+            keep = column_map >= 0
+            model.emission_counts = np.zeros((K, V), dtype=self.emission_counts.dtype)
+            np.add.at(model.emission_counts.T, column_map[keep], self.emission_counts.T[keep])
+        model._build_tables()
+        return model
+
+    def tag_dictionary(self, min_count=20):
+        """
+        Returns the tag dictionary of the training data: for every token seen at
+        least `min_count` times, the set of tags it was observed with. Rarer
+        tokens and <unk> keep every tag as a candidate. It is read off the
+        emission counts, so it needs a model with its count tables.
+
+        Input:
+          min_count: Int, frequency from which a token is restricted to its observed tags
+        Output:
+          tag_dictionary: TagDictionary
+        """
+        K, V = len(self.tag_to_id), len(self.token_to_id)
+        if self.sparse_emissions:
+            counts = self.emission_counts
+            observed = np.zeros((V, K), dtype=bool)
+            observed.reshape(-1)[counts.keys[counts.counts > 0]] = True
+            frequency = np.bincount(counts.keys // K, weights=counts.counts, minlength=V)
+        else:
+            observed = (self.emission_counts > 0).T
+            frequency = self.emission_counts.sum(axis=0)
+        candidates = observed.copy()
+        candidates[frequency < min_count] = True
+        if self.unk_id is not None:
+            candidates[self.unk_id] = True
+        return TagDictionary(candidates, min_count)
+
+    def _copy_counts(self):
+        """
+        Returns a shallow copy of this model with its own count tables, ready for
+        `_build_tables` once its settings are changed.
+        """
+        model = object.__new__(type(self))
+        model.__dict__.update(self.__dict__)
+        model.emission_counts = self.emission_counts.copy()
+        model.transition_counts = self.transition_counts.copy()
+        model.start_counts = self.start_counts.copy()
+        model.token_to_id = dict(self.token_to_id.items())
+        return model
+
+    def _grow_vocab(self, documents):
+        """
+        Adds the tokens of `documents` that are not in the vocabulary, with zero
+        counts, and marks every emission row stale.
+        """
+        if hasattr(documents, "token_ids"):
+            tokens = [documents.vocab[i] for i in np.unique(documents.token_ids)]
+        else:
+            tokens = (token for document in documents for token in document)
+        new_tokens = [token for token in dict.fromkeys(tokens) if token not in self.token_to_id]
+        if not new_tokens:
+            return
+
+        # the vocab list is the caller's; extend a copy of it
+        if hasattr(self.vocab, "token_to_id"):
+            self.vocab = type(self.vocab)(self.vocab)
+        else:
+            self.vocab = list(self.vocab)
+        for token in new_tokens:
+            self.token_to_id[token] = len(self.token_to_id)
+            self.vocab.append(token)
+        self._column_orders = {}
+
+        K = len(self.tag_to_id)
+        if self.sparse_emissions:
+            self.emission_counts.shape = (K, len(self.token_to_id))
+        else:
+            padding = np.zeros((K, len(new_tokens)), dtype=self.emission_counts.dtype)
+            self.emission_counts = np.hstack([self.emission_counts, padding])
+            self._emission_log_probs = np.hstack(
+                [self._emission_log_probs, np.full((K, len(new_tokens)), -np.inf)]
+            )
+        self._stale_emission_rows.update(range(K))
+
+    # version of the archive layout written by `save`
+    FORMAT_VERSION = 1
+
+    def save(self, path, counts=False):
+        """
+        Saves the model as a NumPy archive: the vocabulary (with its byte order, for
+        `TokenTable`), tag list, smoothing constants and log probability tables,
+        plus the format version and a hash of the content, which `load` checks. The
+        tables are stored as they are, so the loaded model gives bit-identical
+        likelihoods and decodings.
+
+        With `counts`, the count tables are stored too, so that the loaded model
+        also supports `partial_fit`, `with_smoothing` and `with_vocab`.
+
+        Input:
+          path: String or file object; '.npz' is appended to paths without it
+          counts: Boolean, whether to store the count tables
+        Output:
+          content_hash: String, SHA-256 of the stored arrays
+        """
+        arrays = self._archive_arrays(counts)
+        content_hash = self._hash_arrays(arrays)
+        np.savez(
+            path,
+            format_version=np.array(self.FORMAT_VERSION),
+            content_hash=np.array(content_hash),
+            **arrays,
+        )
+        return content_hash
+
+    def fingerprint(self):
+        """
+        Returns the SHA-256 of the model's parameters, the hash `save` returns
+        without counts. It is computed on first use and again after `partial_fit`,
+        so equal fingerprints mean equal likelihoods and decodings (e.g. for
+        keying cached predictions).
+
+        Output:
+          fingerprint: String
+        """
+        if self._fingerprint is None:
+            self._fingerprint = self._hash_arrays(self._archive_arrays(counts=False))
+        return self._fingerprint
+
+    @classmethod
+    def load(cls, path, smoothing_func=None):
+        """
+        Loads a model written by `save`. The model is rebuilt from the stored
+        tables alone, without the training data, so `documents` and `labels` are
+        None. `smoothing_func` is only needed to re-smooth a model saved with
+        counts (`partial_fit`, `with_smoothing`, `with_vocab`).
+
+        Raises ValueError if the archive has another format version or its content
+        does not match the stored hash.
+
+        Input:
+          path: String or file object
+          smoothing_func: same as for `HMM`
+        Output:
+          model: HMM, with `content_hash` set to the hash of the archive
+        """
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+        return cls.from_arrays(arrays, smoothing_func)
+
+    @classmethod
+    def from_arrays(cls, arrays, smoothing_func=None, verify=True, token_table=False):
+        """
+        Builds a model from the arrays of an archive written by `save`, by name.
+        The tables are used as they are rather than copied, so they can be
+        memory-mapped from the archive file (see serving.open_model).
+
+        Input:
+          arrays: Dict<key String : value np.ndarray>
+          smoothing_func: same as for `HMM`
+          verify: Boolean, whether to check the content hash
+          token_table: Boolean, whether to keep the vocabulary in the archive
+            arrays as a read-only `TokenTable` (vocab and token_to_id) instead of
+            decoding it; the model then cannot grow its vocabulary
+        Output:
+          model: HMM, with `content_hash` set to the hash of the archive
+        """
+        arrays = dict(arrays)
+        version = int(arrays.pop("format_version"))
+        if version != cls.FORMAT_VERSION:
+            raise ValueError(f"unsupported model format version {version}")
+        content_hash = str(arrays.pop("content_hash"))
+        if verify and cls._hash_arrays(arrays) != content_hash:
+            raise ValueError("model archive does not match its content hash")
+
+        model = object.__new__(cls)
+        model.documents = None
+        model.labels = None
+        if token_table:
+            model.vocab = TokenTable(
+                arrays["vocab"], arrays["vocab_offsets"], arrays["vocab_order"]
+            )
+        else:
+            model.vocab = decode_strings(arrays["vocab"], arrays["vocab_offsets"])
+        model.all_tags = decode_strings(arrays["tags"], arrays["tag_offsets"])
+        model.k_t, model.k_e, model.k_s = arrays["smoothing"].tolist()
+        model.smoothing_func = smoothing_func
+        model.sparse_emissions = bool(arrays["sparse_emissions"])
+        model._set_ids()
+
+        if model.sparse_emissions:
+            emission = SparseEmissions(
+                tuple(arrays["emission_shape"].tolist()), arrays["emission_keys"],
+                arrays["emission_values"], arrays["emission_default"],
+            )
+        else:
+            emission = arrays["emission_log_probs"]
+        model._set_tables(emission, arrays["transition_log_probs"], arrays["start_log_probs"])
+
+        if "transition_counts" in arrays:
+            if model.sparse_emissions:
+                model.emission_counts = PairCounts(
+                    emission.full_shape, arrays["emission_count_keys"], arrays["emission_counts"]
+                )
+            else:
+                model.emission_counts = arrays["emission_counts"]
+            model.transition_counts = arrays["transition_counts"]
+            model.start_counts = arrays["start_counts"]
+            model.num_sequences = int(arrays["num_sequences"])
+        model.content_hash = content_hash
+        return model
+
+    def _archive_arrays(self, counts):
+        """
+        Returns the arrays `save` stores, by name.
+        """
+        if isinstance(self.token_to_id, TokenTable):
+            table = self.token_to_id
+            vocab, vocab_offsets, vocab_order = table.data, table.offsets, table.order
+        else:
+            # the tokens in id order, so that positions are ids
+            vocab, vocab_offsets = encode_strings(self.token_to_id)
+            vocab_order = TokenTable.byte_order(vocab, vocab_offsets)
+        tags, tag_offsets = encode_strings(self.all_tags)
+        arrays = {
+            "vocab": vocab,
+            "vocab_offsets": vocab_offsets,
+            "vocab_order": vocab_order,
+            "tags": tags,
+            "tag_offsets": tag_offsets,
+            "smoothing": np.array([self.k_t, self.k_e, self.k_s], dtype=np.float64),
+            "sparse_emissions": np.array(self.sparse_emissions),
+            "transition_log_probs": self.transition_log_probs,
+            "start_log_probs": self.start_log_probs,
+        }
+        emission = self.emission_log_probs
+        if self.sparse_emissions:
+            arrays["emission_shape"] = np.array(emission.full_shape, dtype=np.int64)
+            arrays["emission_keys"] = emission.keys
+            arrays["emission_values"] = emission.values
+            arrays["emission_default"] = emission.default
+        else:
+            arrays["emission_log_probs"] = emission
+
+        if counts:
+            if self.sparse_emissions:
+                arrays["emission_count_keys"] = self.emission_counts.keys
+                arrays["emission_counts"] = self.emission_counts.counts
+            else:
+                arrays["emission_counts"] = self.emission_counts
+            arrays["transition_counts"] = self.transition_counts
+            arrays["start_counts"] = self.start_counts
+            arrays["num_sequences"] = np.array(self.num_sequences, dtype=np.int64)
+        return arrays
+
+    @staticmethod
+    def _hash_arrays(arrays):
+        """
+        Returns the SHA-256 hex digest of the names, dtypes, shapes and bytes of
+        the given arrays.
+        """
+        # imported here since the import block of this file is fixed
+        import hashlib
+
+        digest = hashlib.sha256()
+        for name in sorted(arrays):
+            array = np.ascontiguousarray(arrays[name])
+            digest.update(f"{name}:{array.dtype.str}:{array.shape};".encode())
+            digest.update(array.reshape(-1).view(np.uint8))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _pack(probs, row_ids, col_ids=None):
+        """
+        Copies a dictionary of log probabilities into a dense array indexed by
+        `row_ids` (and `col_ids` for tuple keys). Entries missing from `probs`,
+        or whose keys have no id, are left at -inf.
+
+        Input:
+          probs: Dict<key String or Tuple[String, String] : value Float>
+          row_ids: Dict<key String : value Int>
+          col_ids: Dict<key String : value Int>, or None for single-key dictionaries
+        Output:
+          table: np.ndarray of shape (len(row_ids),) or (len(row_ids), len(col_ids))
+        """
+        if col_ids is None:
+            table = np.full(len(row_ids), -np.inf)
+            for key, log_prob in probs.items():
+                if key in row_ids:
+                    table[row_ids[key]] = log_prob
+            return table
+
+        table = np.full((len(row_ids), len(col_ids)), -np.inf)
+        for (row, col), log_prob in probs.items():
+            if row in row_ids and col in col_ids:
+                table[row_ids[row], col_ids[col]] = log_prob
+        return table
+
+    def count_statistics(self):
+        """
+        Counts the sufficient statistics of the training data in a single pass over
+        id-encoded sentences and stores them as arrays:
+
+          emission_counts: (K, V), tag-token pair counts (unseen tokens as <unk>),
+            a `PairCounts` with `sparse_emissions`
+          transition_counts: (K, K+1), tag bigram counts, last column is into 'qf'
+          start_counts: (K,), counts of each tag starting a sequence
+          num_sequences: Int, number of label sequences (including empty ones)
+
+        All three tables come from `np.bincount` over combined (row, column) indices.
+        Tags that are not in `all_tags` and transitions out of 'qf' are not counted.
+        A streaming.SentenceStream is counted one chunk at a time.
+        """
+        if hasattr(self.documents, "chunks"):
+            parts = (
+                self._count_pairs(chunk["text"], chunk["NER"])
+                for chunk in self.documents.chunks()
+            )
+        else:
+            parts = [self._count_pairs(self.documents, self.labels)]
+
+        K, V = len(self.tag_to_id), len(self.token_to_id)
+        if self.sparse_emissions:
+            self.emission_counts = PairCounts((K, V))
+        else:
+            self.emission_counts = np.zeros((K, V), dtype=np.int64)
+        self.transition_counts = np.zeros((K, K + 1), dtype=np.int64)
+        self.start_counts = np.zeros(K, dtype=np.int64)
+        self.num_sequences = 0
+        for emission_pairs, transition_pairs, starts, num_sequences in parts:
+            if self.sparse_emissions:
+                self.emission_counts.add(emission_pairs % V * K + emission_pairs // V)
+            else:
+                self.emission_counts += np.bincount(
+                    emission_pairs, minlength=K * V
+                ).reshape(K, V)
+            self.transition_counts += np.bincount(
+                transition_pairs, minlength=K * (K + 1)
+            ).reshape(K, K + 1)
+            self.start_counts += np.bincount(starts, minlength=K)
+            self.num_sequences += num_sequences
+
+    def _count_pairs(self, documents, labels):
+        """
+        Returns the flat cell indices to count for `documents` and `labels`: one
+        entry per emission (tag * V + token), per transition (prev * (K+1) + next)
+        and per sequence start (tag), plus the number of label sequences.
+        """
+        tag_ids, offsets = self._encode_labels(labels)
+        token_ids = self._encode_documents(documents)
+        K, V = len(self.tag_to_id), len(self.token_to_id)
+
+        # emissions: documents and labels are aligned token by token
+        n = min(len(token_ids), len(tag_ids))
+        rows, cols = tag_ids[:n], token_ids[:n]
+        keep = (rows >= 0) & (rows < K) & (cols >= 0)
+        emission_pairs = rows[keep] * V + cols[keep]
+
+        # transitions: each tag to the next tag of its sequence, the last one to 'qf'
+        nonempty = offsets[1:] > offsets[:-1]
+        next_ids = np.empty_like(tag_ids)
+        next_ids[:-1] = tag_ids[1:]
+        next_ids[offsets[1:][nonempty] - 1] = K
+        keep = (tag_ids >= 0) & (tag_ids < K) & (next_ids >= 0)
+        transition_pairs = tag_ids[keep] * (K + 1) + next_ids[keep]
+
+        first = tag_ids[offsets[:-1][nonempty]]
+        starts = first[(first >= 0) & (first < K)]
+        return emission_pairs, transition_pairs, starts, len(offsets) - 1
+
+    def _encode_labels(self, labels):
+        """
+        Returns the flat tag ids of `labels` (columns of the transition table, so
+        'qf' is K and unknown tags are -1) and the sentence offsets into them.
+        """
+        if hasattr(labels, "corpus"):
+            # the 'NER' view of a corpus.Corpus
+            tag_map = np.array(
+                [self.next_tag_to_id.get(tag, -1) for tag in labels.names], dtype=int
+            )
+            return tag_map[labels.values], labels.corpus.offsets
+
+        lengths = [len(sequence) for sequence in labels]
+        offsets = np.zeros(len(lengths) + 1, dtype=int)
+        np.cumsum(lengths, out=offsets[1:])
+        lookup = self.next_tag_to_id.get
+        tag_ids = np.fromiter(
+            (lookup(tag, -1) for sequence in labels for tag in sequence),
+            dtype=int,
+            count=offsets[-1],
+        )
+        return tag_ids, offsets
+
+    def _encode_documents(self, documents):
+        """
+        Returns the flat token ids of `documents`, with tokens outside the
+        vocabulary mapped to <unk> (-1 if there is no <unk>).
+        """
+        unk_id = -1 if self.unk_id is None else self.unk_id
+        if hasattr(documents, "token_ids"):
+            # a corpus.Corpus, translated from its own vocabulary
+            token_map = np.array(
+                [self.token_to_id.get(token, unk_id) for token in documents.vocab],
+                dtype=int,
+            )
+            return token_map[documents.token_ids]
+
+        def tokens():
+            # documents may be nested one level deeper, e.g. the
+            # (new_documents, vocab) pair returned by handle_unknown_words
+            for document in documents:
+                for token in document:
+                    if type(token) == list:
+                        yield from token
+                    else:
+                        yield token
+
+        lookup = self.token_to_id.get
+        return np.fromiter((lookup(token, unk_id) for token in tokens()), dtype=int)
+
+    def _smooth(self, k, name, col_ids, unique_obs, rows=None):
+        """
+        Returns the smoothed log probability table for the given `rows` (default:
+        all) of the (K, len(col_ids)) count table `name` using `smoothing_func`.
+        When the smoothing function provides an array version
+        (`smoothing_func.matrix_version`, see helpers.apply_smoothing) the counts
+        are smoothed directly, with the columns in `unique_obs` order so the result
+        matches the dictionary version exactly; otherwise the counts are handed to
+        `smoothing_func` as a dictionary.
+        """
+        if rows is None:
+            rows = range(len(self.tag_to_id))
+        counts = getattr(self, name)[list(rows)]
+
+        matrix_version = getattr(self.smoothing_func, "matrix_version", None)
+        if matrix_version is not None:
+            order = self._column_order(name, col_ids, unique_obs)
+            table = np.full(counts.shape, -np.inf)
+            table[:, order] = matrix_version(k, counts[:, order])
+            return table
+
+        tags = list(self.tag_to_id)
+        row_ids = {tags[row]: i for i, row in enumerate(rows)}
+        count_rows = counts.tolist()
+        observation_counts = defaultdict(int)
+        for tag, i in row_ids.items():
+            for obs, j in col_ids.items():
+                observation_counts[(tag, obs)] = count_rows[i][j]
+        log_probs = self.smoothing_func(
+            k=k, observation_counts=observation_counts, unique_obs=unique_obs
+        )
+        return self._pack(log_probs, row_ids, col_ids)
+
+    def _column_order(self, name, col_ids, unique_obs):
+        """
+        Returns the columns of `col_ids` in `unique_obs` order for the count table
+        `name`, as a slice when that is the id order already. Building it takes a
+        pass over the vocabulary, so it is kept until the ids change.
+        """
+        order = self._column_orders.get(name)
+        if order is None:
+            order = [col_ids[obs] for obs in dict.fromkeys(unique_obs)]
+            if order == list(range(len(col_ids))):
+                order = slice(None)
+            self._column_orders[name] = order
+        return order
+
+    def _smooth_transitions(self, rows=None):
+        possible_next_tags = list(self.all_tags)
+        if "qf" not in possible_next_tags:
+            possible_next_tags.append("qf")
+        return self._smooth(
+            self.k_t, "transition_counts", self.next_tag_to_id, possible_next_tags, rows
+        )
+
+    def _smooth_emissions(self, rows=None):
+        if self.sparse_emissions:
+            return self._smooth_sparse_emissions(rows)
+        return self._smooth(
+            self.k_e, "emission_counts", self.token_to_id, self.vocab, rows
+        )
+
+    def _smooth_sparse_emissions(self, rows=None):
+        """
+        Returns the SparseEmissions table of the emission counts. With `rows`, only
+        the pairs of those rows are re-smoothed; the other values are carried over
+        from the current table, whose pairs are a subset of the counted ones.
+        Carrying them over and indexing the new table still take O(pairs + V).
+        """
+        counts = self.emission_counts
+        K, V = counts.shape
+        sparse_version = self.smoothing_func.sparse_version
+        if rows is None or len(rows) == K:
+            values, default = sparse_version(self.k_e, counts.keys, counts.counts, K, V)
+            return SparseEmissions(counts.shape, counts.keys, values, default)
+
+        previous = self._emission_log_probs
+        values = np.empty(len(counts.keys))
+        values[np.searchsorted(counts.keys, previous.keys)] = previous.values
+        default = previous.default.copy()
+        stale = np.isin(counts.keys % K, rows)
+        values[stale], row_default = sparse_version(
+            self.k_e, counts.keys[stale], counts.counts[stale], K, V
+        )
+        default[rows] = row_default[rows]
+        return SparseEmissions(counts.shape, counts.keys, values, default)
+
+    def _smooth_starts(self):
+        # Apply k_s smoothing
+        smoothed_counts = self.start_counts + self.k_s
+        total_smoothed = self.num_sequences + self.k_s * (len(self.all_tags) - 1)
+        return np.log(smoothed_counts / total_smoothed)
+
+    @staticmethod
+    def _unpack(table, row_ids, col_ids=None):
+        """
+        Inverse of `_pack`: returns the dictionary of every entry of `table`.
+        """
+        if col_ids is None:
+            return {key: table[i] for key, i in row_ids.items()}
+        return {
+            (row, col): table[i, j]
+            for row, i in row_ids.items()
+            for col, j in col_ids.items()
+        }
 
     def build_transition_matrix(self):
         """
@@ -62,43 +785,7 @@ class HMM:
         Returns a dictionary mapping (tag_{i-1}, tag_i) -> log probability,
         including transitions into 'qf' (final state), but not *from* 'qf'.
         """
-
-        possible_prev_tags = [t for t in self.all_tags if t != "qf"]
-        possible_next_tags = list(self.all_tags)
-        if "qf" not in possible_next_tags:
-            possible_next_tags.append("qf")
-
-        transition_counts = defaultdict(int)
-        for pt in possible_prev_tags:
-            for nt in possible_next_tags:
-                transition_counts[(pt, nt)] = 0
-
-        for tag_sequence in self.labels:
-            if not tag_sequence:
-                continue
-            for i in range(len(tag_sequence) - 1):
-                pt = tag_sequence[i]
-                nt = tag_sequence[i + 1]
-                if pt != "qf":
-                    transition_counts[(pt, nt)] += 1
-            last_tag = tag_sequence[-1]
-            if last_tag != "qf":
-                transition_counts[(last_tag, "qf")] += 1
-
-        transition_log_probs = self.smoothing_func(
-            k=self.k_t,
-            observation_counts=transition_counts,
-            unique_obs=possible_next_tags, 
-        )
-
-        transition_matrix = {}
-        for (pt, nt), log_prob in transition_log_probs.items():
-            if pt == "qf":
-                # We do not allow transitions *from* 'qf'
-                continue
-            transition_matrix[(pt, nt)] = log_prob
-
-        return transition_matrix
+        return self._unpack(self._smooth_transitions(), self.tag_to_id, self.next_tag_to_id)
 
     def build_emission_matrix(self):
         """
@@ -117,51 +804,7 @@ class HMM:
           emission_matrix: Dict<key Tuple[String, String] : value Float>
           Its size should be len(vocab) * len(all_tags).
         """
-
-        valid_tags = [t for t in self.all_tags if t != "qf"]
-        c  = 0
-        new = []
-        tgnew = []
-        for i in self.documents:
-            for j in i:
-                if type(j) == list:
-                    for elem in j:
-                        new.append(elem)
-                else:
-                    new.append(j)
-        for i in self.labels:
-            for j in i:
-                if type(j) == list:
-                    for elem in j:
-                        if type(elem) == list:
-                            for l in elem:
-                                tgnew.append(l)
-                        else:
-                            tgnew.append(elem)
-                else:
-                    tgnew.append(j)
-        
-        emission_counts = defaultdict(int)
-        for tag in valid_tags:
-            for token in self.vocab:
-                emission_counts[(tag, token)] = 0
-        for token, tag in zip(new, tgnew):
-                if tag == "qf":
-                    continue
-                if token not in self.vocab:
-                    token = "<unk>"
-                emission_counts[(tag, token)] += 1
-        emission_log_probs = self.smoothing_func(
-            k=self.k_e,
-            observation_counts=emission_counts,
-            unique_obs=self.vocab,  
-        )
-
-        emission_matrix = {}
-        for (tag, token), log_prob in emission_log_probs.items():
-            emission_matrix[(tag, token)] = log_prob
-
-        return emission_matrix
+        return self._unpack(self._smooth_emissions(), self.tag_to_id, self.token_to_id)
 
     def get_start_state_probs(self):
         """
@@ -180,22 +823,7 @@ class HMM:
         Output:
           start_state_probs: Dict<key String : value Float>
         """
-        start_state_counts = defaultdict(int)
-
-        for sequence in self.labels:
-            if sequence:
-                # get the start tag and increment count
-                start_state_counts[sequence[0]] += 1
-
-        start_state_probs = {}
-        total_sequences = len(self.labels)
-        # Apply k_s smoothing
-        for tag in self.all_tags:
-            if tag != "qf":
-                smoothed_count = start_state_counts[tag] + self.k_s
-                total_smoothed = total_sequences + self.k_s * (len(self.all_tags) - 1)
-                start_state_probs[tag] = np.log(smoothed_count / total_smoothed)
-        return start_state_probs
+        return self._unpack(self._smooth_starts(), self.tag_to_id)
 
     def get_tag_likelihood(self, predicted_tag, previous_tag, document, i):
         """
@@ -222,25 +850,397 @@ class HMM:
         Output:
           result: Float
         """
+        tag_id = self.tag_to_id.get(predicted_tag)
         if i == 0:
-            if predicted_tag not in self.start_state_probs:
+            if tag_id is None:
                 return float("-inf")
-            transition_prob = self.start_state_probs[predicted_tag]
+            transition_prob = self.start_log_probs[tag_id]
         else:
             # Not first state so we can use the actual transition probability
-            if (previous_tag, predicted_tag) not in self.transition_matrix:
+            previous_id = self.tag_to_id.get(previous_tag)
+            next_id = self.next_tag_to_id.get(predicted_tag)
+            if previous_id is None or next_id is None:
                 return float("-inf")
-            transition_prob = self.transition_matrix[(previous_tag, predicted_tag)]
+            transition_prob = self.transition_log_probs[previous_id, next_id]
 
         if predicted_tag == "qf":
             return transition_prob
 
-        token = document[i]
-        if token not in self.vocab:
-            token = "<unk>"
-
-        if (predicted_tag, token) not in self.emission_matrix:
+        # Unseen tokens are treated as <unk>
+        token_id = self.token_to_id.get(document[i], self.unk_id)
+        if token_id is None:
             return float("-inf")
-        emission_prob = self.emission_matrix[(predicted_tag, token)]
+        emission_prob = self.emission_log_probs[tag_id, token_id]
 
         return transition_prob + emission_prob
+
+
+def encode_strings(strings):
+    """
+    Returns `strings` as one UTF-8 byte array and the offsets of each string in
+    it, the form model and corpus archives store string lists in.
+    """
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def decode_strings(data, offsets):
+    """
+    Inverse of `encode_strings`.
+    """
+    data = data.tobytes()
+    bounds = offsets.tolist()
+    return [data[lo:hi].decode("utf-8") for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+class TokenTable:
+    """
+    Read-only token -> id mapping over a vocabulary stored as by `encode_strings`
+    (token i is data[offsets[i]:offsets[i + 1]]) and `order`, the ids sorted by
+    token bytes. Tokens are found by binary search over the first 8 bytes of the
+    sorted tokens and checked against the data, so the vocabulary is never
+    decoded into Python strings and arrays memory-mapped from a model archive stay
+    shared between processes (see serving.open_model). Besides the 8 bytes per
+    token of search keys, it holds no memory of its own.
+
+    Iterating gives the tokens in id order, so it also stands in for the vocab list.
+    `lookup` encodes a whole list of tokens at once; single tokens (`get`, e.g.
+    from `HMM.get_tag_likelihood`) take one binary search each and are memoized
+    up to `MEMO_SIZE` tokens, since decoders ask for the same token repeatedly.
+    """
+
+    MEMO_SIZE = 1024
+
+    def __init__(self, data, offsets, order):
+        """
+        Input:
+          data: np.ndarray[uint8], UTF-8 bytes of all tokens
+          offsets: np.ndarray[int64], of shape (V + 1,)
+          order: np.ndarray[int64], of shape (V,), token ids in byte order
+        """
+        # plain views, since indexing a np.memmap goes through Python code
+        self.data = np.asarray(data)
+        self.offsets = np.asarray(offsets)
+        self.order = np.asarray(order)
+        self.prefixes = self._prefixes(
+            self.data, self.offsets[self.order], self.offsets[self.order + 1]
+        )
+        self._memo = {}
+
+    @staticmethod
+    def byte_order(data, offsets):
+        """
+        Returns the ids of the tokens stored in `data` and `offsets`, sorted by
+        their bytes.
+        """
+        raw = data.tobytes()
+        bounds = offsets.tolist()
+        tokens = [raw[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return np.array(sorted(range(len(tokens)), key=tokens.__getitem__), dtype=np.int64)
+
+    @staticmethod
+    def _prefixes(data, starts, ends):
+        """
+        Returns the first 8 bytes of every data[starts[i]:ends[i]], zero padded,
+        as big-endian integers, which sort like the byte strings themselves.
+        """
+        positions = starts[:, None] + np.arange(8)
+        valid = positions < ends[:, None]
+        block = np.zeros(positions.shape, dtype=np.uint8)
+        block[valid] = data[positions[valid]]
+        return block.view(">u8").ravel().astype(np.uint64)
+
+    def _token(self, token_id):
+        return self.data[self.offsets[token_id] : self.offsets[token_id + 1]].tobytes()
+
+    def lookup(self, tokens, default=-1):
+        """
+        Returns the ids of `tokens`, with `default` for tokens outside the table.
+
+        Input:
+          tokens: List[String]
+          default: Int
+        Output:
+          token_ids: np.ndarray of shape (len(tokens),)
+        """
+        encoded = [token.encode("utf-8") for token in tokens]
+        token_ids = np.full(len(encoded), default, dtype=int)
+        if not encoded or not len(self.order):
+            return token_ids
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        ends = np.cumsum(lengths)
+        query = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        keys = self._prefixes(query, ends - lengths, ends)
+        lo = np.searchsorted(self.prefixes, keys, side="left")
+        hi = np.searchsorted(self.prefixes, keys, side="right")
+
+        # a single token with the same first 8 bytes and length is the token
+        # itself when it is at most 8 bytes long; longer ones compare all bytes
+        candidate = self.order[np.minimum(lo, len(self.order) - 1)]
+        same_length = (hi - lo == 1) & (
+            self.offsets[candidate + 1] - self.offsets[candidate] == lengths
+        )
+        short = same_length & (lengths <= 8)
+        token_ids[short] = candidate[short]
+        longer = np.flatnonzero(same_length & ~short)
+        if len(longer):
+            sizes = lengths[longer]
+            firsts = np.cumsum(sizes) - sizes
+            within = np.arange(sizes.sum()) - np.repeat(firsts, sizes)
+            equal = np.logical_and.reduceat(
+                self.data[np.repeat(self.offsets[candidate[longer]], sizes) + within]
+                == query[np.repeat(ends[longer] - sizes, sizes) + within],
+                firsts,
+            )
+            token_ids[longer[equal]] = candidate[longer[equal]]
+        # tokens sharing their first 8 bytes with others
+        for i in np.flatnonzero(hi - lo > 1):
+            for token_id in self.order[lo[i] : hi[i]]:
+                if self._token(token_id) == encoded[i]:
+                    token_ids[i] = token_id
+                    break
+        return token_ids
+
+    def _find(self, token):
+        """
+        Returns the id of one token, or -1.
+        """
+        encoded = token.encode("utf-8")
+        key = int.from_bytes(encoded[:8].ljust(8, b"\0"), "big")
+        prefixes, order, offsets = self.prefixes, self.order, self.offsets
+        i = int(prefixes.searchsorted(np.uint64(key)))
+        while i < len(order) and prefixes[i] == key:
+            token_id = int(order[i])
+            start, end = offsets[token_id : token_id + 2].tolist()
+            if end - start == len(encoded) and self.data[start:end].tobytes() == encoded:
+                return token_id
+            i += 1
+        return -1
+
+    def get(self, token, default=None):
+        token_id = self._memo.get(token)
+        if token_id is None:
+            if not isinstance(token, str):
+                return default
+            token_id = self._find(token)
+            if len(self._memo) >= self.MEMO_SIZE:
+                self._memo.clear()
+            self._memo[token] = token_id
+        return default if token_id < 0 else token_id
+
+    def __getitem__(self, token):
+        token_id = self.get(token)
+        if token_id is None:
+            raise KeyError(token)
+        return token_id
+
+    def __contains__(self, token):
+        return self.get(token) is not None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        raw = self.data.tobytes()
+        bounds = self.offsets.tolist()
+        return (raw[lo:hi].decode("utf-8") for lo, hi in zip(bounds[:-1], bounds[1:]))
+
+    def items(self):
+        return zip(self, range(len(self)))
+
+
+class TagDictionary:
+    """
+    Candidate tags of every token: `candidates[token_id, tag_id]` is True if the
+    decoders may assign the tag (model tag ids) to the token. Built by
+    `HMM.tag_dictionary`.
+    """
+
+    def __init__(self, candidates, min_count):
+        self.candidates = candidates
+        self.min_count = min_count
+
+    def __len__(self):
+        # number of tokens restricted to fewer than all tags
+        return int(np.sum(~self.candidates.all(axis=1)))
+
+
+class ParameterView:
+    """
+    Read-only dictionary over one of the dense HMM parameter tables, so that
+    `emission_matrix[(tag, token)]`, `transition_matrix[(prev_tag, tag)]` and
+    `start_state_probs[tag]` keep working without storing a boxed key per cell.
+    """
+
+    def __init__(self, model, name, row_ids, col_ids=None):
+        """
+        Input:
+          model: HMM model owning the table
+          name: String, attribute of `model` holding the table (1-D if `col_ids`
+            is None, 2-D otherwise); it is looked up on every access so the view
+            follows `partial_fit` updates
+          row_ids: Dict<key String : value Int>, row index of each key (or first key element)
+          col_ids: Dict<key String : value Int>, column index of the second key element
+        """
+        self.model = model
+        self.name = name
+        self.row_ids = row_ids
+        self.col_ids = col_ids
+
+    @property
+    def table(self):
+        return getattr(self.model, self.name)
+
+    def _position(self, key):
+        try:
+            if self.col_ids is None:
+                return self.row_ids[key]
+            row, col = key
+            return self.row_ids[row], self.col_ids[col]
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def __getitem__(self, key):
+        position = self._position(key)
+        if position is None:
+            raise KeyError(key)
+        return self.table[position]
+
+    def __contains__(self, key):
+        return self._position(key) is not None
+
+    def __len__(self):
+        return self.table.size
+
+    def __iter__(self):
+        if self.col_ids is None:
+            return iter(self.row_ids)
+        return ((row, col) for row in self.row_ids for col in self.col_ids)
+
+    def get(self, key, default=None):
+        position = self._position(key)
+        return default if position is None else self.table[position]
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        table = self.table
+        return [table[self._position(key)] for key in self]
+
+    def items(self):
+        table = self.table
+        return [(key, table[self._position(key)]) for key in self]
+
+
+class PairCounts:
+    """
+    Sparse (K, V) count matrix that keeps only its non-zero entries. Entries are
+    keyed by token * K + tag, so keys stay valid when the vocabulary grows.
+    """
+
+    def __init__(self, shape, keys=None, counts=None):
+        self.shape = shape
+        self.keys = np.zeros(0, dtype=np.int64) if keys is None else keys
+        self.counts = np.zeros(0, dtype=np.int64) if counts is None else counts
+
+    def add(self, keys, counts=None):
+        """
+        Adds `counts` occurrences (default: one) for every entry of `keys`. Only
+        the new keys are sorted; inserting them still moves the stored arrays,
+        O(number of stored pairs).
+        """
+        if counts is None:
+            counts = np.ones(len(keys), dtype=np.int64)
+        keys, inverse = np.unique(np.asarray(keys, dtype=np.int64), return_inverse=True)
+        counts = np.bincount(inverse, weights=counts, minlength=len(keys)).astype(np.int64)
+
+        # the stored keys are sorted, so only the new ones are inserted, in place
+        positions = np.searchsorted(self.keys, keys)
+        new = positions == len(self.keys)
+        new[~new] = self.keys[positions[~new]] != keys[~new]
+        self.keys = np.insert(self.keys, positions[new], keys[new])
+        self.counts = np.insert(self.counts, positions[new], 0)
+        self.counts[positions + np.cumsum(new) - new] += counts
+
+    def copy(self):
+        return PairCounts(self.shape, self.keys.copy(), self.counts.copy())
+
+
+class SparseEmissions:
+    """
+    (K, V) emission log probability table storing only the observed (tag, token)
+    pairs plus one default log probability per tag, which is what every unseen
+    pair of that tag gets under add-k smoothing. Memory grows with the number of
+    observed pairs instead of K * V.
+
+    Indexing with a (tag id, token id) pair gives the same value the dense table
+    would; `columns` gathers the dense (K, n) block for a list of token ids, and
+    `np.asarray(table)` materializes the full dense table.
+    """
+
+    ndim = 2
+
+    def __init__(self, shape, keys, values, default, row_order=None):
+        """
+        Input:
+          shape: Tuple[Int, Int], (K, V)
+          keys: np.ndarray, sorted observed pairs as token * K + tag
+          values: np.ndarray, log probability of each pair in `keys`
+          default: np.ndarray of shape (K,), log probability of unseen pairs per tag
+          row_order: np.ndarray, if given, the tag ids of the rows of this table
+        """
+        self.full_shape = shape
+        self.keys = keys
+        self.values = values
+        self.default = default
+        self.row_order = row_order
+        self.shape = shape if row_order is None else (len(row_order), shape[1])
+        # observed pairs of token j are keys[indptr[j]:indptr[j + 1]]
+        self.indptr = np.searchsorted(keys, np.arange(shape[1] + 1) * shape[0])
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    def __getitem__(self, position):
+        if not isinstance(position, tuple):
+            # selecting rows, e.g. reordering the tags for a decoder
+            return SparseEmissions(
+                self.full_shape, self.keys, self.values, self.default,
+                self._rows()[np.asarray(position)],
+            )
+        row, col = position
+        row = self._rows()[row]
+        key = col * self.full_shape[0] + row
+        i = np.searchsorted(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.values[i]
+        return self.default[row]
+
+    def _rows(self):
+        if self.row_order is None:
+            return np.arange(self.full_shape[0])
+        return self.row_order
+
+    def columns(self, token_ids):
+        """
+        Returns the dense (K, len(token_ids)) block of log probabilities of the
+        given tokens under every row.
+        """
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        block = np.repeat(self.default[:, None], len(token_ids), axis=1)
+        starts = self.indptr[token_ids]
+        lengths = self.indptr[token_ids + 1] - starts
+        # positions of all observed pairs of the requested tokens
+        column = np.repeat(np.arange(len(token_ids)), lengths)
+        pairs = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pairs += np.repeat(starts, lengths)
+        block[self.keys[pairs] % self.full_shape[0], column] = self.values[pairs]
+        return block if self.row_order is None else block[self.row_order]
+
+    def __array__(self, dtype=None, copy=None):
+        table = self.columns(np.arange(self.shape[1]))
+        return table if dtype is None else table.astype(dtype)
@@ -0,0 +1,235 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# Parallel decoding helpers. The HMM parameter tables (for sparse emissions,
+# only the observed pairs) are copied once into a shared memory block that every
+# worker process maps, or, for a model saved with `HMM.save`, every worker maps
+# the model file itself (serving.ModelHandle), so tasks only carry the sentences
+# they decode.
+################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import os
+import numpy as np
+from models import SparseEmissions
+from serving import ModelHandle
+from viterbi import encode_corpus, viterbi_batch
+
+
+class SharedParameters:
+    """
+    Publishes the start, transition and emission log-prob tables of an HMM in a
+    single shared memory block. A sparse emission table (models.SparseEmissions)
+    is published as its keys, values and per-tag defaults rather than densified.
+    `spec()` returns everything a worker needs to rebuild a decodable model on
+    top of that block as a `SharedModel`.
+    """
+
+    TABLES = ("start_log_probs", "transition_log_probs", "emission_log_probs")
+    SPARSE_EMISSION_ARRAYS = ("keys", "values", "default")
+
+    def __init__(self, model):
+        """
+        Input:
+          model: HMM model
+        """
+        emission = model.emission_log_probs
+        tables = [("start_log_probs", model.start_log_probs),
+                  ("transition_log_probs", model.transition_log_probs)]
+        if isinstance(emission, SparseEmissions):
+            self.emission_shape = emission.full_shape
+            tables += [("emission_" + name, getattr(emission, name))
+                       for name in self.SPARSE_EMISSION_ARRAYS]
+        else:
+            self.emission_shape = None
+            tables.append(("emission_log_probs", emission))
+        tables = [(name, np.ascontiguousarray(table)) for name, table in tables]
+
+        # every table starts at a multiple of 8 bytes, so all dtypes stay aligned
+        self.layout = []
+        offset = 0
+        for name, table in tables:
+            self.layout.append((name, table.shape, table.dtype.str, offset))
+            offset += -(-table.nbytes // 8) * 8
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, offset))
+        for (name, table), (_, _, _, offset) in zip(tables, self.layout):
+            view = np.ndarray(table.shape, dtype=table.dtype, buffer=self.shm.buf, offset=offset)
+            view[...] = table
+
+        self.tag_to_id = model.tag_to_id
+        self.next_tag_to_id = model.next_tag_to_id
+        self.tokens = list(model.token_to_id)
+
+    def spec(self):
+        """
+        Returns the picklable description of the block handed to each worker once.
+        """
+        return (self.shm.name, self.layout, self.emission_shape,
+                self.tag_to_id, self.next_tag_to_id, self.tokens)
+
+    def close(self):
+        """
+        Releases and removes the shared memory block.
+        """
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedModel:
+    """
+    Read-only stand-in for an HMM inside a worker process. It exposes the same
+    id maps and parameter tables as `HMM`, with the tables backed by the shared
+    memory block, so it can be passed to `viterbi_vectorized` and `viterbi_batch`.
+    """
+
+    def __init__(self, spec):
+        name, layout, emission_shape, tag_to_id, next_tag_to_id, tokens = spec
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.tag_to_id = tag_to_id
+        self.next_tag_to_id = next_tag_to_id
+        self.token_to_id = {token: i for i, token in enumerate(tokens)}
+        self.unk_id = self.token_to_id.get("<unk>")
+
+        tables = {}
+        for table_name, shape, dtype, offset in layout:
+            table = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)
+            table.flags.writeable = False
+            tables[table_name] = table
+        self.start_log_probs = tables["start_log_probs"]
+        self.transition_log_probs = tables["transition_log_probs"]
+        if emission_shape is None:
+            self.emission_log_probs = tables["emission_log_probs"]
+        else:
+            self.emission_log_probs = SparseEmissions(
+                emission_shape,
+                *(tables["emission_" + name] for name in SharedParameters.SPARSE_EMISSION_ARRAYS),
+            )
+
+
+# model attached by each worker process in `_attach`, or the handle of the
+# model file it maps in `_attach_file`
+_worker_model = None
+_worker_handle = None
+
+
+def _attach(spec):
+    global _worker_model
+    _worker_model = SharedModel(spec)
+
+
+def _attach_file(path):
+    global _worker_handle
+    _worker_handle = ModelHandle(path)
+
+
+def _decode_shard(shard, tags, batch_size):
+    if _worker_handle is not None:
+        # picks up a model file replaced since the previous shard
+        return _worker_handle.predict(shard, tags, batch_size)
+    return viterbi_batch(_worker_model, shard, tags, batch_size)
+
+
+class ParallelDecoder:
+    """
+    A pool of `num_workers` decoding processes attached to one model, kept open
+    across calls so that a sequence of `predict` calls (e.g. the chunks of a
+    streaming.SentenceStream) starts the workers and publishes the parameter
+    tables only once. Close it, or use it as a context manager.
+
+    with ParallelDecoder(model, num_workers=4) as decoder:
+        for chunk in stream.chunks():
+            predictions = decoder.predict(chunk["text"], tags)
+    """
+
+    def __init__(self, model, num_workers):
+        """
+        Input:
+          model: HMM model, or the path of a model saved with `HMM.save`, which the
+            workers then memory-map instead of receiving a copy of the tables
+          num_workers: Int, number of worker processes
+        """
+        self.model = model
+        self.num_workers = num_workers
+        self.shared = None
+        if isinstance(model, (str, os.PathLike)):
+            initializer, initargs = _attach_file, (model,)
+        else:
+            self.shared = SharedParameters(model)
+            initializer, initargs = _attach, (self.shared.spec(),)
+        try:
+            self.executor = ProcessPoolExecutor(
+                max_workers=num_workers, initializer=initializer, initargs=initargs
+            )
+        except BaseException:
+            self.close()
+            raise
+
+    def predict(self, observations, tags, batch_size=None):
+        """
+        Returns the predicted tag sequences for `observations`, in their original
+        order, decoding contiguous shards in the worker processes. The
+        predictions are identical to calling `viterbi` on each observation.
+
+        Input:
+          observations: List[List[String]], List[np.ndarray] of token ids or corpus.Corpus
+          tags: List[String]
+          batch_size: Int, sentences decoded together by `viterbi_batch` in each worker
+        Output:
+          predictions: List[List[String]]
+        """
+        if batch_size is None:
+            batch_size = 256
+        # with a model file, which may be replaced while decoding, a Corpus is only
+        # encoded by the workers, under whichever model decodes a shard
+        if hasattr(observations, "offsets") and self.shared is not None:
+            observations = encode_corpus(self.model, observations)
+        num_shards = max(1, min(len(observations), self.num_workers * 4))
+        bounds = np.linspace(0, len(observations), num_shards + 1).astype(int)
+        futures = [
+            self.executor.submit(_decode_shard, observations[lo:hi], tags, batch_size)
+            for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+        predictions = []
+        for future in futures:
+            predictions.extend(future.result())
+        return predictions
+
+    def close(self):
+        """
+        Shuts the workers down and releases the shared parameter tables.
+        """
+        executor = getattr(self, "executor", None)
+        if executor is not None:
+            executor.shutdown()
+            self.executor = None
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def predict_parallel(model, observations, tags, num_workers, batch_size=None):
+    """
+    Returns the predicted tag sequences for `observations`, in their original
+    order, decoding contiguous shards in `num_workers` worker processes. The
+    predictions are identical to calling `viterbi` on each observation. To
+    decode several batches with the same workers, use `ParallelDecoder`.
+
+    Input:
+      model: HMM model, or the path of a model saved with `HMM.save`, which the
+        workers then memory-map instead of receiving a copy of the tables
+      observations: List[List[String]], List[np.ndarray] of token ids or corpus.Corpus
+      tags: List[String]
+      num_workers: Int, number of worker processes
+      batch_size: Int, sentences decoded together by `viterbi_batch` in each worker
+    Output:
+      predictions: List[List[String]]
+    """
+    with ParallelDecoder(model, num_workers) as decoder:
+        return decoder.predict(observations, tags, batch_size)
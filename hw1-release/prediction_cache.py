@@ -0,0 +1,158 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# A bounded LRU cache of decoded sentences, for traffic that repeats the same
+# lines (headlines, datelines, result tables). Entries are keyed on the token
+# ids of the sentence after <unk> replacement, so sentences that only differ in
+# unknown words share an entry, and on the model's parameter fingerprint, so an
+# updated or replaced model never answers from stale predictions.
+################################################################################
+
+from collections import OrderedDict
+import threading
+from viterbi import encode_observation, viterbi_batch
+
+# approximate bytes per entry besides the key and the tag sequence: the
+# OrderedDict node, the key tuple and the two container headers
+_ENTRY_OVERHEAD = 200
+
+
+class PredictionCache:
+    """
+    An opt-in LRU cache in front of `viterbi_batch`. Only whole sentences are
+    cached, since the best path of a sub-sequence depends on its context.
+
+    The cache serves one model at a time: when it is used with a model whose
+    `fingerprint()` differs from the one its entries were decoded with (after
+    `partial_fit`, or a new model from `ModelHandle`), all entries are dropped.
+
+    cache = PredictionCache(max_entries=100000, max_bytes=64 << 20)
+    predictions = cache.predict(model, observations, tags)
+    cache.stats()   # {'hits': ..., 'misses': ..., 'evictions': ..., ...}
+    """
+
+    def __init__(self, max_entries=100000, max_bytes=64 << 20):
+        """
+        Input:
+          max_entries: Int, most sentences kept
+          max_bytes: Int, approximate bound on the memory held by the entries
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns the cache counters and its current size.
+
+        Output:
+          stats: Dict, with keys 'hits', 'misses', 'evictions', 'invalidations',
+            'entries', 'bytes' and 'hit_rate'
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        """
+        Drops every entry; the counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _check_model(self, model):
+        # called with the lock held
+        fingerprint = model.fingerprint()
+        if fingerprint != self._fingerprint:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._fingerprint = fingerprint
+
+    def _add(self, key, prediction):
+        # called with the lock held
+        size = len(key[1]) + 8 * len(prediction) + _ENTRY_OVERHEAD
+        if size > self.max_bytes or self.max_entries < 1:
+            return
+        self._entries[key] = prediction
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            old_key, old_prediction = self._entries.popitem(last=False)
+            self._bytes -= len(old_key[1]) + 8 * len(old_prediction) + _ENTRY_OVERHEAD
+            self.evictions += 1
+
+    def predict(self, model, observations, tags, batch_size=256):
+        """
+        Returns the same predicted tag sequences as `viterbi_batch`. Sentences
+        seen before (under the same model and tags) are answered from the cache;
+        the others, each distinct one once, are decoded together with
+        `viterbi_batch` and added to it.
+
+        Input:
+          model: HMM model
+          observations: List[List[String]] or List[np.ndarray] of token ids
+          tags: List[String]
+          batch_size: Int, number of sentences decoded together
+        Output:
+          predictions: List[List[String]]
+        """
+        tags_key = tuple(tags)
+        keys = [
+            (tags_key, encode_observation(model, observation).astype("<i8").tobytes())
+            for observation in observations
+        ]
+        predictions = [None] * len(observations)
+        pending = {}  # key -> positions still to decode
+        with self._lock:
+            self._check_model(model)
+            fingerprint = self._fingerprint
+            for position, key in enumerate(keys):
+                prediction = self._entries.get(key)
+                if prediction is not None:
+                    self._entries.move_to_end(key)
+                    predictions[position] = list(prediction)
+                    self.hits += 1
+                else:
+                    pending.setdefault(key, []).append(position)
+                    self.misses += 1
+
+        if pending:
+            decoded = viterbi_batch(
+                model, [observations[positions[0]] for positions in pending.values()],
+                tags, batch_size,
+            )
+            with self._lock:
+                # another thread may have switched models while this one decoded
+                store = self._fingerprint == fingerprint
+                for (key, positions), prediction in zip(pending.items(), decoded):
+                    for position in positions:
+                        predictions[position] = list(prediction)
+                    if store:
+                        self._add(key, tuple(prediction))
+        return predictions
+
+    def viterbi(self, model, observation, tags):
+        """
+        Returns the predicted tag sequence for one observation, as `viterbi`
+        does, through the cache.
+        """
+        return self.predict(model, [observation], tags)[0]
@@ -0,0 +1,166 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# Serving a saved HMM from many decoding processes. `open_model` memory-maps the
+# tables of an archive written by `HMM.save`, so every process on a host reads
+# the same physical pages, and `ModelHandle` switches a running worker to a newer
+# model file once it has been replaced with `publish_model`.
+################################################################################
+
+import os
+import tempfile
+import threading
+import zipfile
+import numpy as np
+from models import HMM
+from viterbi import viterbi_batch
+
+
+def _map_archive(file):
+    """
+    Returns the arrays of an uncompressed .npz archive, by name, as read-only
+    memory maps into `file`.
+    """
+    arrays = {}
+    with zipfile.ZipFile(file) as archive:
+        members = archive.infolist()
+    for member in members:
+        if member.compress_type != zipfile.ZIP_STORED:
+            raise ValueError(f"{member.filename} is compressed and cannot be memory-mapped")
+        # the member data follows its local header, whose name and extra field
+        # lengths may differ from the central directory's
+        file.seek(member.header_offset + 26)
+        name_length, extra_length = np.frombuffer(file.read(4), dtype="<u2")
+        file.seek(member.header_offset + 30 + int(name_length) + int(extra_length))
+        version = np.lib.format.read_magic(file)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+
+        name = member.filename[: -len(".npy")]
+        if dtype.hasobject:
+            raise ValueError(f"{name} holds Python objects")
+        if np.prod(shape) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+            continue
+        array = np.memmap(
+            file, dtype=dtype, mode="r", offset=file.tell(), shape=shape or (1,),
+            order="F" if fortran_order else "C",
+        )
+        arrays[name] = array.reshape(shape) if shape == () else array
+    return arrays
+
+
+def open_model(path, smoothing_func=None, verify=True):
+    """
+    Opens a model saved with `HMM.save` with its tables memory-mapped read-only
+    instead of loaded, so processes that open the same file share its pages. The
+    vocabulary stays in the file too, as a models.TokenTable searched in place,
+    so a process only adds 8 bytes per token of search keys. The model decodes
+    exactly like one from `HMM.load` but must not be updated (`partial_fit`);
+    `with_smoothing` and `with_vocab` return ordinary copies.
+
+    Input:
+      path: String, path of the archive
+      smoothing_func: same as for `HMM`
+      verify: Boolean, whether to check the content hash (reads every page once)
+    Output:
+      model: HMM
+    """
+    with open(path, "rb") as file:
+        return HMM.from_arrays(_map_archive(file), smoothing_func, verify, token_table=True)
+
+
+def publish_model(model, path, counts=False):
+    """
+    Saves `model` to `path` atomically: the archive is written to a temporary file
+    next to it and renamed over `path`, so a reader either maps the old file or
+    the complete new one. Files that may be mapped must only be replaced this way;
+    rewriting them in place would change the tables under running decoders.
+
+    Input:
+      model: HMM model
+      path: String
+      counts: Boolean, see `HMM.save`
+    Output:
+      content_hash: String
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            content_hash = model.save(file, counts=counts)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return content_hash
+
+
+class ModelHandle:
+    """
+    The current memory-mapped model of a file that may be replaced while it is in
+    use. `current()` switches to the newer file when there is one; the switch is a
+    single reference swap, so calls that already hold the previous model finish
+    on it, and its file stays mapped until they drop it.
+
+    handle = ModelHandle("model.npz")
+    predictions = handle.predict(observations, tags)   # picks up new files
+    """
+
+    def __init__(self, path, smoothing_func=None, verify=True, cache=None):
+        """
+        Input:
+          path: String, path of an archive written by `HMM.save` or `publish_model`
+          smoothing_func: same as for `HMM`
+          verify: Boolean, whether to check the content hash of every file opened
+          cache: prediction_cache.PredictionCache, if given, `predict` goes
+            through it; it is invalidated whenever a new model is loaded
+        """
+        self.path = path
+        self.smoothing_func = smoothing_func
+        self.verify = verify
+        self.cache = cache
+        self.model = None
+        self._stamp = None
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """
+        Opens the file again if it has been replaced since the last load. If the
+        new file cannot be opened, the error is raised and the current model is kept.
+
+        Output:
+          switched: Boolean, whether a new model was loaded
+        """
+        with self._lock:
+            with open(self.path, "rb") as file:
+                info = os.fstat(file.fileno())
+                stamp = (info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns)
+                if stamp == self._stamp:
+                    return False
+                model = HMM.from_arrays(
+                    _map_archive(file), self.smoothing_func, self.verify, token_table=True
+                )
+            self.model, self._stamp = model, stamp
+            return True
+
+    def current(self):
+        """
+        Returns the newest model, reloading first if the file has been replaced.
+        """
+        self.reload()
+        return self.model
+
+    def predict(self, observations, tags, batch_size=256):
+        """
+        Returns the predicted tag sequences for `observations` under the newest
+        model; see `viterbi_batch`.
+        """
+        if self.cache is not None:
+            return self.cache.predict(self.current(), observations, tags, batch_size)
+        return viterbi_batch(self.current(), observations, tags, batch_size)
@@ -0,0 +1,309 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# Reading corpora one sentence at a time instead of loading whole splits with
+# `read_json`. The column-oriented dataset files ({"index": [...], "text": [...],
+# "NER": [...]}) are parsed incrementally, one reader per column, and JSONL
+# shards (one {"index", "text", "NER"} object per line) are read line by line,
+# so memory stays bounded by the chunk size rather than the corpus size.
+################################################################################
+
+import codecs
+import json
+import os
+
+# columns of a dataset split, in the order sentences are yielded
+COLUMNS = ("index", "text", "NER")
+
+
+class _JsonReader:
+    """
+    Incremental JSON reader over a binary file, starting at a byte offset. Values
+    are decoded one at a time with `json.JSONDecoder.raw_decode` from a buffer
+    that is refilled in `block_size` pieces, so a column of a dataset file can be
+    read element by element.
+    """
+
+    WHITESPACE = " \t\n\r"
+
+    def __init__(self, file, offset=0, block_size=1 << 16):
+        file.seek(offset)
+        self.file = file
+        self.block_size = block_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.base = offset  # byte offset of buffer[0]
+        self.eof = False
+
+    def _fill(self):
+        consumed = self.buffer[: self.pos]
+        self.base += len(consumed.encode("utf-8"))
+        block = self.file.read(self.block_size)
+        self.eof = not block
+        self.buffer = self.buffer[self.pos :] + self.decoder.decode(block, final=self.eof)
+        self.pos = 0
+
+    def byte_offset(self):
+        """
+        Returns the byte offset in the file of the next unread character.
+        """
+        return self.base + len(self.buffer[: self.pos].encode("utf-8"))
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character ('' at the end of file).
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos : self.pos + 1]
+            self._fill()
+
+    def expect(self, chars):
+        """
+        Consumes the next character, which must be one of `chars`, and returns it.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"expected one of {chars!r} at byte {self.byte_offset()}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decodes and returns the next JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                self._fill()
+                continue
+            # a number or literal ending at the buffer end may continue in the
+            # next block
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """
+        Yields the elements of the JSON array that starts at the next character.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+
+def column_offsets(path):
+    """
+    Returns the byte offset of the value of every top-level key of a JSON object
+    file. Column values are skipped element by element, so this never holds more
+    than one element in memory.
+
+    Input:
+      path: String, path of a column-oriented dataset file
+    Output:
+      offsets: Dict<key String : value Int>
+    """
+    offsets = {}
+    with open(path, "rb") as f:
+        reader = _JsonReader(f)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return offsets
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            reader.peek()
+            offsets[key] = reader.byte_offset()
+            if reader.peek() == "[":
+                for _ in reader.items():
+                    pass
+            else:
+                reader.value()
+            if reader.expect(",}") == "}":
+                return offsets
+
+
+def iter_json_sentences(path):
+    """
+    Yields the sentences of a column-oriented dataset file (as written for
+    `read_json`) as (index, text, NER) triples, one at a time. The file is opened
+    once per column, each reader positioned at the start of its column. Columns
+    the file does not have (e.g. 'NER' in test.json) are None in every triple.
+
+    Input:
+      path: String
+    Output:
+      sentences: generator of Tuple[List[Int], List[String], List[String]]
+    """
+    offsets = column_offsets(path)
+    if "text" not in offsets:
+        raise ValueError(f"{path} has no 'text' column")
+    files = {key: open(path, "rb") for key in COLUMNS if key in offsets}
+    try:
+        columns = [
+            _JsonReader(files[key], offsets[key]).items() if key in files else None
+            for key in COLUMNS
+        ]
+        for text in columns[1]:
+            yield tuple(
+                text if i == 1 else (None if column is None else next(column))
+                for i, column in enumerate(columns)
+            )
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def iter_jsonl_sentences(path):
+    """
+    Yields the sentences of a JSONL shard, one {"index", "text", "NER"} object per
+    line, as (index, text, NER) triples. Missing keys are None.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                sentence = json.loads(line)
+                yield tuple(sentence.get(key) for key in COLUMNS)
+
+
+def write_jsonl_shards(sentences, directory, shard_size=10000):
+    """
+    Writes (index, text, NER) triples to JSONL shards of `shard_size` sentences
+    named part-00000.jsonl, part-00001.jsonl, ... and returns their paths.
+
+    Input:
+      sentences: iterable of Tuple[List[Int], List[String], List[String]], e.g. a SentenceStream
+      directory: String, created if needed
+      shard_size: Int, sentences per shard
+    Output:
+      paths: List[String]
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths, f = [], None
+    try:
+        for i, sentence in enumerate(sentences):
+            if i % shard_size == 0:
+                if f is not None:
+                    f.close()
+                paths.append(os.path.join(directory, f"part-{len(paths):05d}.jsonl"))
+                f = open(paths[-1], "w", encoding="utf-8")
+            record = {key: value for key, value in zip(COLUMNS, sentence) if value is not None}
+            f.write(json.dumps(record) + "\n")
+    finally:
+        if f is not None:
+            f.close()
+    return paths
+
+
+class SentenceStream:
+    """
+    A re-iterable stream of (index, text, NER) sentence triples read from
+    column-oriented JSON files and/or JSONL shards. Each iteration reads the files
+    again, so only the current sentence (or chunk) is in memory.
+
+    Like a `read_json` dictionary, `stream["text"]`, `stream["NER"]` and
+    `stream["index"]` are per-sentence columns, here re-iterable rather than
+    lists. A stream can be passed directly to `handle_unknown_words`, to `HMM` (as
+    both documents and labels) and to `evaluate_model`, which read it
+    `chunk_size` sentences at a time.
+
+    stream = SentenceStream(["train.json"], drop_last_token=True)
+    stream, vocab = handle_unknown_words(0.01, stream)
+    model = HMM(stream, stream, vocab, all_tags, k_t, k_e, k_s, apply_smoothing)
+    """
+
+    def __init__(self, paths, chunk_size=1024, drop_last_token=False, vocab=None):
+        """
+        Input:
+          paths: String or List[String], files ending in '.jsonl' are read as JSONL
+            shards, all others as column-oriented JSON
+          chunk_size: Int, sentences per chunk from `chunks`
+          drop_last_token: Boolean, whether to drop the last token (and label and
+            index) of every sentence, the preprocessing the notebook applies
+          vocab: List[String] or helpers.Vocabulary, if given, tokens outside it are
+            replaced with <unk>
+        """
+        self.paths = [paths] if isinstance(paths, (str, os.PathLike)) else list(paths)
+        self.chunk_size = chunk_size
+        self.drop_last_token = drop_last_token
+        self.vocab = vocab
+        self._known = None
+        if vocab is not None:
+            self._known = vocab.token_to_id if hasattr(vocab, "token_to_id") else set(vocab)
+
+    def __iter__(self):
+        for path in self.paths:
+            if os.fspath(path).endswith(".jsonl"):
+                sentences = iter_jsonl_sentences(path)
+            else:
+                sentences = iter_json_sentences(path)
+            for index, text, ner in sentences:
+                if self.drop_last_token:
+                    index = None if index is None else index[:-1]
+                    text = text[:-1]
+                    ner = None if ner is None else ner[:-1]
+                if self._known is not None:
+                    known = self._known
+                    text = [token if token in known else "<unk>" for token in text]
+                yield index, text, ner
+
+    def __getitem__(self, key):
+        if key not in COLUMNS:
+            raise KeyError(key)
+        return _StreamColumn(self, COLUMNS.index(key))
+
+    def chunks(self):
+        """
+        Yields the stream as `read_json`-style dictionaries of `chunk_size`
+        sentences each. Columns the files do not have are left out.
+        """
+        chunk = []
+        for sentence in self:
+            chunk.append(sentence)
+            if len(chunk) == self.chunk_size:
+                yield _to_dataset(chunk)
+                chunk = []
+        if chunk:
+            yield _to_dataset(chunk)
+
+    def with_vocab(self, vocab):
+        """
+        Returns the same stream with tokens outside `vocab` replaced with <unk>.
+        """
+        return SentenceStream(self.paths, self.chunk_size, self.drop_last_token, vocab)
+
+
+class _StreamColumn:
+    """
+    One column of a SentenceStream; every iteration reads the stream again.
+    """
+
+    def __init__(self, stream, position):
+        self.stream = stream
+        self.position = position
+
+    def __iter__(self):
+        return (sentence[self.position] for sentence in self.stream)
+
+
+def _to_dataset(sentences):
+    return {
+        key: [sentence[i] for sentence in sentences]
+        for i, key in enumerate(COLUMNS)
+        if sentences[0][i] is not None
+    }
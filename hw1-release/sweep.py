@@ -0,0 +1,275 @@
+# Name(s): Abdulgani Muhammedsani, Edwin Dake
+# Netid(s): amm546, ed433
+################################################################################
+# Hyperparameter sweeps over the add-k smoothing constants and the <unk>
+# threshold. The training data is counted once; every point only re-derives the
+# parameter tables from the counts (`HMM.with_smoothing`, `HMM.with_vocab`) and
+# decodes the validation set. `sweep_beam_width` traces the speed/accuracy curve
+# of beam search for a fixed model, `sweep_tag_restriction` the accuracy of
+# restricting tokens to their tag-dictionary candidates, and
+# `sweep_kbest` the cost and oracle accuracy of k-best lists.
+################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import time
+from validation import evaluate_model, flatten_double_lst, format_output_labels, mean_f1
+from viterbi import viterbi_batch, viterbi_beam_batch, viterbi_kbest_batch
+
+
+def smoothing_grid(k_t_values, k_e_values, k_s_values):
+    """
+    Returns every (k_t, k_e, k_s) combination of the given values.
+    """
+    return list(product(k_t_values, k_e_values, k_s_values))
+
+
+def evaluate_smoothing(model, val_set, tags, k_t, k_e, k_s, batch_size=256):
+    """
+    Returns one row of the sweep table: the smoothing constants, the mean F1 on
+    `val_set` and the time spent re-smoothing and evaluating.
+    """
+    start = time.perf_counter()
+    smoothed = model.with_smoothing(k_t, k_e, k_s)
+    smoothed_at = time.perf_counter()
+    f1 = evaluate_model(smoothed, val_set, tags, batch_size=batch_size)
+    return {
+        "k_t": k_t,
+        "k_e": k_e,
+        "k_s": k_s,
+        "f1": f1,
+        "smoothing_time": smoothed_at - start,
+        "eval_time": time.perf_counter() - smoothed_at,
+    }
+
+
+# model, validation set and tags set up once in each worker by `_init_worker`
+_worker_args = None
+
+
+def _init_worker(model, val_set, tags, batch_size):
+    global _worker_args
+    _worker_args = (model, val_set, tags, batch_size)
+
+
+def _evaluate_point(point):
+    model, val_set, tags, batch_size = _worker_args
+    return evaluate_smoothing(model, val_set, tags, *point, batch_size=batch_size)
+
+
+def sweep_smoothing(model, val_set, tags, grid, num_workers=None, batch_size=256):
+    """
+    Evaluates `model` re-smoothed with every (k_t, k_e, k_s) in `grid` and returns
+    the sweep table, one row per grid point in grid order. The model's counts are
+    reused for every point, so a sweep costs about one smoothing pass and one
+    validation decode per point rather than one training run.
+
+    Input:
+      model: HMM model, trained once on the training data
+      val_set: Dictionary<key String, value List[List[Any]]> or corpus.Corpus, validation set
+      tags: List[String], all possible NER tags
+      grid: List[Tuple[Float, Float, Float]], (k_t, k_e, k_s) points, e.g. from `smoothing_grid`
+      num_workers: Int, if given, grid points are spread over this many processes
+      batch_size: Int, sentences decoded together by `viterbi_batch`
+    Output:
+      results: List[Dict], with keys 'k_t', 'k_e', 'k_s', 'f1', 'smoothing_time'
+        and 'eval_time' (seconds)
+    """
+    if num_workers is None:
+        return [
+            evaluate_smoothing(model, val_set, tags, *point, batch_size=batch_size)
+            for point in grid
+        ]
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        initializer=_init_worker,
+        initargs=(model, val_set, tags, batch_size),
+    ) as executor:
+        return list(executor.map(_evaluate_point, grid))
+
+
+def sweep_unknown_threshold(model, ranks, thresholds, val_set, tags, batch_size=256):
+    """
+    Evaluates the model for every `handle_unknown_words` threshold in
+    `thresholds` and returns the sweep table, one row per threshold. Each model is
+    derived from `model` with `HMM.with_vocab`, folding the replaced tokens' counts
+    into <unk>, so the training data is only counted once.
+
+    Input:
+      model: HMM model trained over `ranks.full_vocab()`
+      ranks: helpers.FrequencyRanks of the training documents
+      thresholds: List[Float], values of `t`
+      val_set: Dictionary<key String, value List[List[Any]]> or corpus.Corpus, validation set
+      tags: List[String], all possible NER tags
+      batch_size: Int, sentences decoded together by `viterbi_batch`
+    Output:
+      results: List[Dict], with keys 't', 'vocab_size', 'f1', 'derive_time' and
+        'eval_time' (seconds)
+    """
+    results = []
+    for t in thresholds:
+        start = time.perf_counter()
+        derived = model.with_vocab(ranks.vocab(t))
+        derived_at = time.perf_counter()
+        f1 = evaluate_model(derived, val_set, tags, batch_size=batch_size)
+        results.append({
+            "t": t,
+            "vocab_size": len(derived.vocab),
+            "f1": f1,
+            "derive_time": derived_at - start,
+            "eval_time": time.perf_counter() - derived_at,
+        })
+    return results
+
+
+def sweep_beam_width(model, val_set, tags, widths, batch_size=256):
+    """
+    Decodes the validation set with beam search for every width in `widths` and
+    returns the sweep table, one row per width, comparing each against exact
+    Viterbi (`viterbi_batch`): the mean F1, the share of sentences and tokens
+    whose tags agree with the exact decoding, and the decoding throughput.
+
+    Input:
+      model: HMM model
+      val_set: Dictionary<key String, value List[List[Any]]>, validation set
+      tags: List[String], all possible NER tags
+      widths: List[Int], beam widths
+      batch_size: Int, sentences decoded together
+    Output:
+      results: List[Dict], with keys 'beam_width', 'f1', 'sentence_agreement',
+        'token_agreement', 'tokens_per_second' and 'eval_time' (seconds)
+    """
+    observations = val_set["text"]
+    num_tokens = sum(len(sentence) for sentence in observations)
+    indices = flatten_double_lst(val_set["index"])
+    true_dict = format_output_labels(flatten_double_lst(val_set["NER"]), indices)
+    exact = viterbi_batch(model, observations, tags, batch_size)
+    exact_tokens = flatten_double_lst(exact)
+
+    results = []
+    for width in widths:
+        start = time.perf_counter()
+        predictions = viterbi_beam_batch(model, observations, tags, width, batch_size)
+        elapsed = time.perf_counter() - start
+        predicted_tokens = flatten_double_lst(predictions)
+        results.append({
+            "beam_width": width,
+            "f1": mean_f1(format_output_labels(predicted_tokens, indices), true_dict),
+            "sentence_agreement": sum(p == e for p, e in zip(predictions, exact)) / max(1, len(exact)),
+            "token_agreement": sum(
+                p == e for p, e in zip(predicted_tokens, exact_tokens)
+            ) / max(1, num_tokens),
+            "tokens_per_second": num_tokens / elapsed,
+            "eval_time": elapsed,
+        })
+    return results
+
+
+def sweep_tag_restriction(model, val_set, tags, min_counts, batch_size=256):
+    """
+    Decodes the validation set with the output restricted to tag-dictionary
+    candidates (`HMM.tag_dictionary`) for every frequency cutoff in `min_counts`
+    and returns the sweep table, one row per cutoff, compared against exact
+    Viterbi like `sweep_beam_width`. The restriction only changes which paths
+    may be returned, not the cost of decoding, so no timings are reported.
+
+    Input:
+      model: HMM model, with its count tables
+      val_set: Dictionary<key String, value List[List[Any]]>, validation set
+      tags: List[String], all possible NER tags
+      min_counts: List[Int], frequency cutoffs
+      batch_size: Int, sentences decoded together
+    Output:
+      results: List[Dict], with keys 'min_count', 'restricted_tokens', 'f1',
+        'sentence_agreement' and 'token_agreement'
+    """
+    observations = val_set["text"]
+    num_tokens = sum(len(sentence) for sentence in observations)
+    indices = flatten_double_lst(val_set["index"])
+    true_dict = format_output_labels(flatten_double_lst(val_set["NER"]), indices)
+    exact = viterbi_batch(model, observations, tags, batch_size)
+    exact_tokens = flatten_double_lst(exact)
+
+    results = []
+    for min_count in min_counts:
+        tag_dictionary = model.tag_dictionary(min_count)
+        predictions = viterbi_batch(
+            model, observations, tags, batch_size, tag_dictionary=tag_dictionary
+        )
+        predicted_tokens = flatten_double_lst(predictions)
+        results.append({
+            "min_count": min_count,
+            "restricted_tokens": len(tag_dictionary),
+            "f1": mean_f1(format_output_labels(predicted_tokens, indices), true_dict),
+            "sentence_agreement": sum(p == e for p, e in zip(predictions, exact)) / max(1, len(exact)),
+            "token_agreement": sum(
+                p == e for p, e in zip(predicted_tokens, exact_tokens)
+            ) / max(1, num_tokens),
+        })
+    return results
+
+
+def sweep_kbest(model, val_set, tags, ks, batch_size=256):
+    """
+    Decodes the validation set with `viterbi_kbest_batch` for every list size in
+    `ks` and returns one row per size: the average number of sequences returned,
+    the oracle token accuracy (per sentence, the sequence of the list that gets
+    the most tags right), the score gap between the best and the last sequence,
+    and the decoding throughput.
+
+    Input:
+      model: HMM model
+      val_set: Dictionary<key String, value List[List[Any]]>, validation set
+      tags: List[String], all possible NER tags
+      ks: List[Int], list sizes
+      batch_size: Int, sentences decoded together
+    Output:
+      results: List[Dict], with keys 'k', 'sequences', 'oracle_accuracy',
+        'score_gap', 'tokens_per_second' and 'eval_time' (seconds)
+    """
+    observations, labels = val_set["text"], val_set["NER"]
+    num_tokens = sum(len(sentence) for sentence in observations)
+
+    results = []
+    for k in ks:
+        start = time.perf_counter()
+        sequences, scores = viterbi_kbest_batch(model, observations, tags, k, batch_size)
+        elapsed = time.perf_counter() - start
+        correct = sum(
+            max(sum(p == t for p, t in zip(sequence, gold)) for sequence in candidates)
+            for candidates, gold in zip(sequences, labels)
+        )
+        results.append({
+            "k": k,
+            "sequences": sum(len(candidates) for candidates in sequences) / max(1, len(sequences)),
+            "oracle_accuracy": correct / max(1, num_tokens),
+            "score_gap": sum(score[0] - score[-1] for score in scores) / max(1, len(scores)),
+            "tokens_per_second": num_tokens / elapsed,
+            "eval_time": elapsed,
+        })
+    return results
+
+
+def format_results(results):
+    """
+    Returns a sweep table as text, best F1 first when the rows have an F1. Times
+    are shown in ms.
+    """
+    columns = list(results[0]) if results else []
+    headers = [column[:-5] + " ms" if column.endswith("_time") else column for column in columns]
+    widths = [max(10, len(header)) for header in headers]
+    lines = [" ".join(f"{header:>{width}}" for header, width in zip(headers, widths))]
+    if "f1" in columns:
+        results = sorted(results, key=lambda row: -row["f1"])
+    for row in results:
+        cells = []
+        for column, width in zip(columns, widths):
+            if column.endswith("_time"):
+                cells.append(f"{row[column] * 1000:>{width}.1f}")
+            elif column == "f1":
+                cells.append(f"{row[column]:>{width}.4f}")
+            else:
+                cells.append(f"{row[column]:>{width}g}")
+        lines.append(" ".join(cells))
+    return "\n".join(lines)
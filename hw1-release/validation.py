@@ -39,25 +39,313 @@ def format_output_labels(token_labels, token_indices):
         then dictionary returned is
         {'LOC': [], 'MISC': [], 'ORG': [(15, 16), (19, 19)], 'PER': []}
     """
+    # each distinct label is split once; the spans are found on its id array
+    label_to_id = {}
+    tag_ids = np.fromiter(
+        (label_to_id.setdefault(label, len(label_to_id)) for label in token_labels),
+        dtype=np.int64, count=len(token_labels),
+    )
+    return entity_spans(tag_ids, token_indices, list(label_to_id))
+
+
+def _tag_types(tags):
+    """
+    Returns the entity type names of `tags` ('O' first) and, per tag, its type id
+    (0 for 'O') and whether it is a B- tag.
+    """
+    names = ["O"]
+    for tag in tags:
+        name = tag.split("-")[-1]
+        if name not in names:
+            names.append(name)
+    types = np.array([names.index(tag.split("-")[-1]) for tag in tags], dtype=np.int64)
+    begins = np.array([tag.startswith("B-") for tag in tags], dtype=bool)
+    return names, types, begins
+
+
+def _entity_bounds(types, begins):
+    """
+    Returns the positions where entities start and end in a labelling given as
+    per-token type ids (0 for 'O') and B- flags, with the rules of
+    `format_output_labels`: an entity starts at a B- tag or a change of type and
+    ends before the next 'O', B- tag or change of type.
+    """
+    inside = types != 0
+    previous = np.concatenate([[0], types[:-1]])
+    starts = inside & (begins | (types != previous))
+    next_types = np.concatenate([types[1:], [0]])
+    next_begins = np.concatenate([begins[1:], [True]])
+    ends = inside & (next_begins | (types != next_types))
+    return np.flatnonzero(starts), np.flatnonzero(ends)
+
+
+def entity_spans(tag_ids, token_indices, tags):
+    """
+    Returns the same dictionary as `format_output_labels` for labels given as
+    ids into `tags` (e.g. decoder output before it is turned into strings). The
+    entity boundaries are found with array comparisons of neighbouring tokens
+    rather than a loop over the tokens.
+
+    Input:
+      tag_ids: np.ndarray of shape (N,), ids into `tags`
+      token_indices: List[Int] or np.ndarray of shape (N,), dataset token indices
+      tags: List[String], e.g. ["B-ORG", "I-ORG", ..., "O"]
+    Output:
+      result: Dictionary<key String: value List[Tuple]>, mapping labels to spans
+    """
     label_dict = {"LOC": [], "MISC": [], "ORG": [], "PER": []}
-    prev_label = "O"
-    start = token_indices[0]
-    for idx, label in enumerate(token_labels):
-        curr_label = label.split("-")[-1]
-        if label.startswith("B-") or (curr_label != prev_label and curr_label != "O"):
-            if prev_label != "O":
-                label_dict[prev_label].append((start, token_indices[idx - 1]))
-            start = token_indices[idx]
-        elif label == "O" and prev_label != "O":
-            label_dict[prev_label].append((start, token_indices[idx - 1]))
-            start = None
-
-        prev_label = curr_label
-    if start is not None and prev_label != "O":
-        label_dict[prev_label].append((start, token_indices[idx]))
+    names, tag_types, tag_begins = _tag_types(tags)
+    tag_ids = np.asarray(tag_ids, dtype=np.int64)
+    types = tag_types[tag_ids]
+    starts, ends = _entity_bounds(types, tag_begins[tag_ids])
+    token_indices = np.asarray(token_indices)
+    span_types = types[starts]
+    for type_id in np.unique(span_types):
+        selected = span_types == type_id
+        label_dict[names[type_id]].extend(zip(
+            token_indices[starts[selected]].tolist(), token_indices[ends[selected]].tolist()
+        ))
     return label_dict
 
 
+class SpanEvaluator:
+    """
+    Streaming entity-level evaluation: predicted and true labels are fed in
+    pieces with `update`, and only per-label counts of true positive, predicted
+    and true spans are kept, plus the at most two spans per side that touch the
+    ends of what has been seen so far and may still grow. `mean_f1()` gives the
+    same score as `mean_f1` over `format_output_labels` of all the labels fed so
+    far, including entities that continue from one piece into the next.
+
+    Evaluators of consecutive parts of the data (e.g. shards decoded by
+    different workers) combine with `merge`, in data order. Token indices must
+    be unique, as they are within a dataset split.
+
+    evaluator = SpanEvaluator()
+    for predictions, labels, indices in shards:
+        evaluator.update(predictions, labels, indices)
+    evaluator.mean_f1()
+    """
+
+    LABELS = ("LOC", "MISC", "ORG", "PER")
+
+    def __init__(self):
+        self.true_positives = dict.fromkeys(self.LABELS, 0)
+        self.num_pred = dict.fromkeys(self.LABELS, 0)
+        self.num_true = dict.fromkeys(self.LABELS, 0)
+        # spans touching the first or last token seen, as
+        # [label, start, end, at_first, at_last, first token is B-]
+        self._pred_edges = []
+        self._true_edges = []
+        self._empty = True
+
+    def update(self, predicted_labels, true_labels, token_indices):
+        """
+        Input:
+          predicted_labels: List[String], the next predicted token labels
+          true_labels: List[String], the true labels of the same tokens
+          token_indices: List[Int], the dataset indices of those tokens
+        """
+        if len(token_indices) == 0:
+            return
+        piece = SpanEvaluator()
+        piece._empty = False
+        first, last = token_indices[0], token_indices[-1]
+        interior = {}
+        for side, labels, edges in (
+            ("pred", predicted_labels, piece._pred_edges),
+            ("true", true_labels, piece._true_edges),
+        ):
+            for label, spans in format_output_labels(labels, token_indices).items():
+                inner = []
+                for start, end in spans:
+                    if start == first or end == last:
+                        edges.append([
+                            label, start, end, start == first, end == last,
+                            start == first and labels[0].startswith("B-"),
+                        ])
+                    else:
+                        inner.append((start, end))
+                interior[side, label] = inner
+        for label in self.LABELS:
+            piece._count(label, interior.get(("pred", label), []), interior.get(("true", label), []))
+        self.merge(piece)
+
+    def _count(self, label, pred_spans, true_spans):
+        """
+        Adds spans that can no longer change to the counts.
+        """
+        self.num_pred[label] += len(pred_spans)
+        self.num_true[label] += len(true_spans)
+        pred_set = set(pred_spans)
+        self.true_positives[label] += sum(span in pred_set for span in true_spans)
+
+    @staticmethod
+    def _join(edges, next_edges):
+        """
+        Returns the edge spans of two consecutive parts together and the spans
+        that are now inside, joining the last span of the first part with the
+        first span of the second when it continues it.
+        """
+        tail = next((span for span in edges if span[4]), None)
+        head = next((span for span in next_edges if span[3]), None)
+        if tail is not None and head is not None and tail[0] == head[0] and not head[5]:
+            joined = [tail[0], tail[1], head[2], tail[3], head[4], tail[5]]
+            spans = [span for span in edges if span is not tail] + [joined]
+            spans += [span for span in next_edges if span is not head]
+        else:
+            spans = [span[:4] + [False, span[5]] for span in edges]
+            spans += [span[:3] + [False] + span[4:] for span in next_edges]
+        merged, inside = [], []
+        for span in spans:
+            (merged if span[3] or span[4] else inside).append(span)
+        return merged, inside
+
+    def merge(self, other):
+        """
+        Adds the counts of `other`, an evaluator of the tokens right after this
+        one's, and returns this evaluator.
+        """
+        if other._empty:
+            return self
+        for label in self.LABELS:
+            self.true_positives[label] += other.true_positives[label]
+            self.num_pred[label] += other.num_pred[label]
+            self.num_true[label] += other.num_true[label]
+        if self._empty:
+            self._pred_edges = [list(span) for span in other._pred_edges]
+            self._true_edges = [list(span) for span in other._true_edges]
+            self._empty = False
+            return self
+
+        self._pred_edges, pred_inside = self._join(self._pred_edges, other._pred_edges)
+        self._true_edges, true_inside = self._join(self._true_edges, other._true_edges)
+        for label in self.LABELS:
+            self._count(
+                label,
+                [(span[1], span[2]) for span in pred_inside if span[0] == label],
+                [(span[1], span[2]) for span in true_inside if span[0] == label],
+            )
+        return self
+
+    def counts(self):
+        """
+        Returns the per-label (true positive, predicted, true) span counts of
+        everything fed so far, with the spans at the ends closed.
+        """
+        result = {}
+        for label in self.LABELS:
+            pred_spans = [(span[1], span[2]) for span in self._pred_edges if span[0] == label]
+            true_spans = [(span[1], span[2]) for span in self._true_edges if span[0] == label]
+            pred_set = set(pred_spans)
+            result[label] = (
+                self.true_positives[label] + sum(span in pred_set for span in true_spans),
+                self.num_pred[label] + len(pred_spans),
+                self.num_true[label] + len(true_spans),
+            )
+        return result
+
+    def mean_f1(self):
+        """
+        Returns the mean F1 score over the labels that have true spans, computed
+        like `mean_f1`.
+        """
+        F1_lst = []
+        for num_correct, num_pred, num_true in self.counts().values():
+            if num_true == 0:
+                continue
+            if num_pred != 0 and num_correct != 0:
+                R = num_correct / num_true
+                P = num_correct / num_pred
+                F1_lst.append(2 * P * R / (P + R))
+            else:
+                F1_lst.append(0)
+        return np.mean(F1_lst)
+
+
+# Test Case 1: Entities Continuing Across Sentences
+evaluator_sentences_1 = [
+    (["B-ORG", "I-ORG"], ["B-ORG", "I-ORG"], [0, 1]),
+    (["I-ORG", "O", "B-PER"], ["O", "O", "B-PER"], [2, 3, 4]),
+    (["I-PER"], ["I-PER"], [5]),
+    (["B-PER", "I-LOC"], ["I-PER", "B-LOC"], [6, 7]),
+]
+
+# Test Case 2: B- Tags Splitting Entities at Sentence Starts
+evaluator_sentences_2 = [
+    (["B-LOC"], ["B-LOC"], [10]),
+    (["B-LOC"], ["I-LOC"], [11]),
+    (["I-LOC", "I-LOC"], ["I-LOC", "B-LOC"], [12, 13]),
+    (["O", "I-MISC"], ["B-MISC", "I-MISC"], [14, 15]),
+]
+
+# Test Case 3: One Entity Over Every Sentence
+evaluator_sentences_3 = [
+    (["I-MISC"], ["B-MISC"], [20]),
+    (["I-MISC"], ["I-MISC"], [21]),
+    (["I-MISC"], ["I-MISC"], [22]),
+    (["I-MISC", "O"], ["I-MISC", "B-ORG"], [23, 24]),
+]
+
+# Test Case 4: Single Tokens and Type Changes
+evaluator_sentences_4 = [
+    (["B-PER", "B-PER", "I-ORG"], ["B-PER", "B-PER", "B-ORG"], [30, 31, 32]),
+    (["I-ORG", "I-LOC", "O"], ["I-ORG", "I-LOC", "I-LOC"], [33, 34, 35]),
+    (["O"], ["O"], [36]),
+    (["I-PER", "I-PER"], ["B-PER", "I-PER"], [37, 38]),
+    (["O", "O"], ["B-LOC", "O"], [39, 40]),
+]
+
+evaluator_test_samples = [
+    evaluator_sentences_1,
+    evaluator_sentences_2,
+    evaluator_sentences_3,
+    evaluator_sentences_4,
+]
+
+
+def test_span_evaluator(test_cases):
+    """
+    Checks that a SpanEvaluator gives the same mean F1 as `mean_f1` over
+    `format_output_labels` of all the labels, whether it is fed one sentence or
+    one token at a time, or built from per-sentence evaluators merged in every
+    possible tree order.
+    """
+    def merge_trees(sentences, lo, hi):
+        # every evaluator of sentences[lo:hi] obtainable by merging neighbours
+        if hi - lo == 1:
+            evaluator = SpanEvaluator()
+            evaluator.update(*sentences[lo])
+            yield evaluator
+            return
+        for split in range(lo + 1, hi):
+            for right in merge_trees(sentences, split, hi):
+                for left in merge_trees(sentences, lo, split):
+                    yield left.merge(right)
+
+    for sentences in test_cases:
+        predicted, true, indices = (flatten_double_lst(column) for column in zip(*sentences))
+        expected = mean_f1(
+            format_output_labels(predicted, indices), format_output_labels(true, indices)
+        )
+
+        by_sentence, by_token = SpanEvaluator(), SpanEvaluator()
+        for sentence in sentences:
+            by_sentence.update(*sentence)
+        for i in range(len(indices)):
+            by_token.update(predicted[i : i + 1], true[i : i + 1], indices[i : i + 1])
+        assert by_sentence.mean_f1() == expected, (by_sentence.mean_f1(), expected)
+        assert by_token.mean_f1() == expected, (by_token.mean_f1(), expected)
+
+        num_trees = 0
+        for evaluator in merge_trees(sentences, 0, len(sentences)):
+            assert evaluator.mean_f1() == expected, (evaluator.mean_f1(), expected)
+            num_trees += 1
+        print(f"mean F1 {expected:.4f}, matched by {num_trees} merge orders")
+
+
+# test_span_evaluator(evaluator_test_samples)
+
 def mean_f1(y_pred_dict, y_true_dict):
     """
     Calculates the entity-level mean F1 score given the actual/true and
@@ -74,15 +362,13 @@ def mean_f1(y_pred_dict, y_true_dict):
     """
     F1_lst = []
     for key in y_true_dict:
-        num_correct, num_true = 0, 0
         preds = y_pred_dict[key]
         trues = y_true_dict[key]
-        for true in trues:
-            num_true += 1
-            if true in preds:
-                num_correct += 1
-            else:
-                continue
+        # membership in a set of the predicted spans, so each label is linear
+        # in its number of spans
+        pred_set = set(preds)
+        num_true = len(trues)
+        num_correct = sum(true in pred_set for true in trues)
         num_pred = len(preds)
         if num_true != 0:
             if num_pred != 0 and num_correct != 0:
@@ -97,41 +383,117 @@ def mean_f1(y_pred_dict, y_true_dict):
     return np.mean(F1_lst)
 
 
-def evaluate_model(model, val_set, tags):
+def evaluate_model(
+    model, val_set, tags, batch_size=None, num_workers=None, beam_width=None, constraints=None,
+    tag_dictionary=None,
+):
     """
     Evaluates the model on the validation set `val_tokens` and `val_labels` and
     returns the mean F1 score. Use provided helper function `mean_f1` to compare
     predicted vs. actual labels.
     Input:
       model: HMM model
-      val_set: Dictionary<key String, value List[List[Any]]>, given validation set with keys: 'text', 'NER', 'index'
+      val_set: Dictionary<key String, value List[List[Any]]>, given validation set with keys: 'text', 'NER', 'index',
+        a corpus.Corpus of it, or a streaming.SentenceStream, which is decoded one chunk at a time
       tags: List[String], all possible NER tags
+      batch_size: Int, if given, sentences are decoded `batch_size` at a time with
+        `viterbi_batch` instead of one at a time with `viterbi`
+      num_workers: Int, if given, the validation set is split into shards that are
+        decoded in `num_workers` processes sharing the model parameters
+      beam_width: Int, if given, sentences are decoded with `viterbi_beam_batch`
+        keeping `beam_width` states per position (not combined with `num_workers`)
+      constraints: viterbi.TransitionConstraints, if given, sentences are decoded
+        with `viterbi_batch` restricted to the allowed transitions, e.g. the BIO
+        rules (not combined with `num_workers` or `beam_width`)
+      tag_dictionary: models.TagDictionary, if given, sentences are decoded with
+        `viterbi_batch` restricted to each token's candidate tags (combines with
+        `constraints`, not with `num_workers` or `beam_width`)
     Output:
       mean_F1_score: Float, representing the mean f1 score when the model evaluated using the validation set
     """
-    all_predictions = []
-    all_real_labels = []
-    all_indices = []
+    _check_decoding_options(num_workers, beam_width, constraints, tag_dictionary)
+    if hasattr(val_set, "chunks"):
+        # a streaming.SentenceStream, always decoded in batches
+        chunks, batch_size = val_set.chunks(), batch_size or 256
+    else:
+        chunks = _split_chunks(val_set, batch_size or 256)
+
+    # imported here since the import block of this file is fixed; `parallel` is
+    # only needed with `num_workers`
+    decoder = None
+    if num_workers is not None:
+        from parallel import ParallelDecoder
+
+        decoder = ParallelDecoder(model, num_workers)
+    try:
+        return _evaluate_chunks(
+            model, chunks, tags, batch_size, decoder, beam_width, constraints, tag_dictionary
+        )
+    finally:
+        if decoder is not None:
+            decoder.close()
+
+
+def _check_decoding_options(num_workers, beam_width, constraints, tag_dictionary):
+    """
+    Raises ValueError if `evaluate_model` is asked for decoding options that do
+    not combine: `num_workers` and `beam_width` each exclude all the others, and
+    only `constraints` and `tag_dictionary` go together.
+    """
+    options = {
+        "num_workers": num_workers,
+        "beam_width": beam_width,
+        "constraints": constraints,
+        "tag_dictionary": tag_dictionary,
+    }
+    given = [name for name, value in options.items() if value is not None]
+    if len(given) > 1 and set(given) != {"constraints", "tag_dictionary"}:
+        raise ValueError(f"decoding options {', '.join(given)} cannot be combined")
 
-    # Iterate through each sequence in validation set
-    # we want to compare the true values with the values predicted by our viterbi
-    # algorithm implementation
-    for i in range(len(val_set["text"])):
-        # Get current sequence and its true labels
-        current_sequence = val_set["text"][i]
-        true_labels = val_set["NER"][i]
-        indices = val_set["index"][i]
 
-        # Get model predictions for this sequence
-        predictions = viterbi(model, current_sequence, tags)
+def _split_chunks(val_set, chunk_size):
+    """
+    Yields the validation set `chunk_size` sentences at a time, as sub-corpora of
+    a corpus.Corpus or as dictionaries of list slices.
+    """
+    for lo in range(0, len(val_set["text"]), chunk_size):
+        if hasattr(val_set, "offsets"):
+            yield val_set[lo : lo + chunk_size]
+        else:
+            yield {key: val_set[key][lo : lo + chunk_size] for key in ("text", "NER", "index")}
 
-        # Store predictions, true labels and indices
-        all_predictions.extend(predictions)
-        all_real_labels.extend(true_labels)
-        all_indices.extend(indices)
 
-    predicted_dict = format_output_labels(all_predictions, all_indices)
-    true_dict = format_output_labels(all_real_labels, all_indices)
+def _evaluate_chunks(
+    model, chunks, tags, batch_size, decoder, beam_width, constraints, tag_dictionary
+):
+    """
+    The decoding loop of `evaluate_model`, with `decoder` a parallel.ParallelDecoder
+    or None. Each chunk is decoded and folded into a SpanEvaluator before the
+    next one, so only the span counts are kept; entities may continue from one
+    chunk into the next.
+    """
+    from viterbi import viterbi_batch, viterbi_beam_batch
 
-    # Calculate and return mean F1 score
-    return mean_f1(predicted_dict, true_dict)
+    evaluator = SpanEvaluator()
+    for chunk in chunks:
+        # a corpus.Corpus chunk is handed to the batch decoders whole so they use its ids
+        observations = chunk if hasattr(chunk, "offsets") else chunk["text"]
+        if constraints is not None or tag_dictionary is not None:
+            predictions = viterbi_batch(
+                model, observations, tags, batch_size or 256, constraints, tag_dictionary
+            )
+        elif beam_width is not None:
+            predictions = viterbi_beam_batch(
+                model, observations, tags, beam_width, batch_size or 256
+            )
+        elif decoder is not None:
+            predictions = decoder.predict(observations, tags, batch_size)
+        elif batch_size is not None:
+            predictions = viterbi_batch(model, observations, tags, batch_size)
+        else:
+            predictions = [viterbi(model, sentence, tags) for sentence in chunk["text"]]
+        evaluator.update(
+            flatten_double_lst(predictions), flatten_double_lst(chunk["NER"]),
+            flatten_double_lst(chunk["index"]),
+        )
+    return evaluator.mean_f1()
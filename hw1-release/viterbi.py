@@ -79,3 +79,614 @@ def viterbi(model, observation, tags):
     predictions = [real_tags[i] for i in best_path]
 
     return predictions
+
+
+def get_decoding_tables(model, tags):
+    """
+    Returns the HMM parameter tables rearranged to follow the order of `tags`, so
+    a decoder can index them directly instead of calling `get_tag_likelihood`.
+    Tags the model does not know about get -inf scores, just like they would from
+    `get_tag_likelihood`.
+
+    Input:
+      model: HMM model
+      tags: List[String]
+    Output:
+      real_tags: List[String], `tags` without 'qf'
+      start: np.ndarray of shape (K,), log[P(tag_j)] for the first token
+      transition: np.ndarray of shape (K, K), log[P(tag_j | tag_k)] at [k, j]
+      final: np.ndarray of shape (K,), log[P(qf | tag_k)]
+      emission: RowSelection (or models.SparseEmissions) of shape (K, V),
+        log[P(token | tag_j)] by token id
+    """
+    real_tags = [t for t in tags if t != "qf"]
+    known = np.array([t in model.tag_to_id for t in real_tags], dtype=bool)
+    ids = np.array([model.tag_to_id.get(t, 0) for t in real_tags], dtype=int)
+    qf_id = model.next_tag_to_id["qf"]
+
+    start = np.where(known, model.start_log_probs[ids], -np.inf)
+    transition = model.transition_log_probs[np.ix_(ids, ids)]
+    transition[~known, :] = -np.inf
+    transition[:, ~known] = -np.inf
+    final = np.where(known, model.transition_log_probs[ids, qf_id], -np.inf)
+    # unknown tags can never be entered, so their emission rows need no masking
+    emission = model.emission_log_probs
+    if hasattr(emission, "columns"):
+        emission = emission[ids]
+    else:
+        emission = RowSelection(emission, ids)
+    return real_tags, start, transition, final, emission
+
+
+class RowSelection:
+    """
+    The rows `ids` of a dense (K, V) table, gathered only for the columns a
+    decoder asks for. The table itself is never copied, so a memory-mapped table
+    stays shared between processes (see serving.open_model).
+    """
+
+    ndim = 2
+
+    def __init__(self, table, ids):
+        self.table = table
+        self.ids = ids
+        self.shape = (len(ids), table.shape[1])
+
+    def columns(self, token_ids):
+        """
+        Returns the dense (K, len(token_ids)) block of the selected rows.
+        """
+        return self.table[np.ix_(self.ids, np.asarray(token_ids, dtype=np.int64))]
+
+    def __array__(self, dtype=None, copy=None):
+        table = self.table[self.ids]
+        return table if dtype is None else table.astype(dtype)
+
+
+def encode_observation(model, observation):
+    """
+    Returns the token ids of `observation` under the model vocabulary. Unseen
+    tokens are mapped to <unk>, or to -1 when the vocabulary has no <unk>. An
+    observation that is already an integer array (e.g. from `Vocabulary.encode`
+    with the model's vocabulary) is returned as is.
+
+    Input:
+      model: HMM model
+      observation: List[String] or np.ndarray of token ids
+    Output:
+      token_ids: np.ndarray of shape (N,)
+    """
+    if isinstance(observation, np.ndarray) and observation.dtype.kind in "iu":
+        return observation
+    return _token_ids(model, observation)
+
+
+def _token_ids(model, tokens):
+    """
+    Returns the ids of `tokens` under the model vocabulary, <unk> (or -1) for
+    unseen ones, through `lookup` when the vocabulary is a models.TokenTable.
+    """
+    unk_id = -1 if model.unk_id is None else model.unk_id
+    lookup = getattr(model.token_to_id, "lookup", None)
+    if lookup is not None:
+        return lookup(tokens, unk_id)
+    return np.array([model.token_to_id.get(token, unk_id) for token in tokens], dtype=int)
+
+
+def encode_corpus(model, corpus):
+    """
+    Returns the sentences of a corpus.Corpus as token id arrays under the model
+    vocabulary. Corpus ids are translated with one lookup table over the corpus
+    vocabulary; when the corpus already uses the model's ids the returned arrays
+    are views into `corpus.token_ids`.
+
+    Input:
+      model: HMM model
+      corpus: corpus.Corpus
+    Output:
+      observations: List[np.ndarray]
+    """
+    token_ids = corpus.token_ids
+    if getattr(corpus.vocab, "token_to_id", None) != model.token_to_id:
+        token_ids = _token_ids(model, corpus.vocab)[token_ids]
+    return [token_ids[lo:hi] for lo, hi in zip(corpus.offsets[:-1], corpus.offsets[1:])]
+
+
+def emission_scores(emission, token_ids):
+    """
+    Returns the (N, K) emission log probabilities of each token under each tag,
+    with -inf for tokens that have no id (-1).
+    """
+    if hasattr(emission, "columns"):
+        scores = emission.columns(np.maximum(token_ids, 0)).T
+    else:
+        scores = emission[:, np.maximum(token_ids, 0)].T
+    scores[token_ids < 0] = -np.inf
+    return scores
+
+
+def decoding_batches(model, observations, emission, batch_size, order=None, candidates=None):
+    """
+    Yields the padded batches the batched decoders run over. Sentences are
+    grouped by length to keep padding small; each batch holds up to
+    `batch_size` of them as a (B, N, K) emission score tensor and a (B, N) mask
+    of the positions within each sentence's length.
+
+    Input:
+      model: HMM model
+      observations: List[List[String]] or List[np.ndarray] of token ids
+      emission: emission table from `get_decoding_tables`
+      batch_size: Int, number of sentences per batch
+      order: List[Int], positions of the observations to decode, already sorted
+        by length; by default all non-empty observations
+      candidates: np.ndarray of shape (V, K), if given, the scores of tags that
+        are not candidates of a token (see `candidate_table`) are set to -inf
+    Output:
+      batches: generator of Tuple[List[Int], np.ndarray, np.ndarray, np.ndarray],
+        (positions of the batch's observations, their lengths, emissions, mask)
+    """
+    if order is None:
+        order = sorted(range(len(observations)), key=lambda b: len(observations[b]))
+        order = [b for b in order if len(observations[b]) > 0]
+    for first in range(0, len(order), batch_size):
+        batch = order[first : first + batch_size]
+        lengths = np.array([len(observations[b]) for b in batch])
+        B, N = len(batch), lengths.max()
+
+        # padded token ids; padding positions are masked out by the decoders
+        mask = np.arange(N)[None, :] < lengths[:, None]
+        token_ids = np.zeros((B, N), dtype=int)
+        sentences = [observations[b] for b in batch]
+        if any(isinstance(sentence, np.ndarray) for sentence in sentences):
+            for row, sentence in enumerate(sentences):
+                token_ids[row, : lengths[row]] = encode_observation(model, sentence)
+        else:
+            # one vocabulary lookup for the whole batch, row by row
+            tokens = [token for sentence in sentences for token in sentence]
+            token_ids[mask] = _token_ids(model, tokens)
+        emissions = emission_scores(emission, token_ids.ravel()).reshape(B, N, -1)
+        if candidates is not None:
+            # tags outside a token's candidates can never be entered
+            emissions = np.where(candidates[np.maximum(token_ids, 0)], emissions, -np.inf)
+        yield batch, lengths, emissions, mask
+
+
+def candidate_table(model, tags, tag_dictionary):
+    """
+    Returns the candidate tags of every token from a models.TagDictionary, in
+    the order of `tags` (without 'qf').
+
+    Input:
+      model: HMM model
+      tags: List[String]
+      tag_dictionary: models.TagDictionary
+    Output:
+      candidates: np.ndarray[bool] of shape (V, K)
+    """
+    real_tags = [t for t in tags if t != "qf"]
+    known = np.array([t in model.tag_to_id for t in real_tags], dtype=bool)
+    ids = np.array([model.tag_to_id.get(t, 0) for t in real_tags], dtype=int)
+    return tag_dictionary.candidates[:, ids] & known[None, :]
+
+
+def viterbi_vectorized(model, observation, tags):
+    """
+    Returns the same predicted tag sequence as `viterbi`, but reads the model's
+    parameter tables once and performs each time step as a single (K, K)
+    broadcasted add and argmax instead of K^2 `get_tag_likelihood` calls.
+
+    Input:
+      model: HMM model
+      observation: List[String] or np.ndarray of token ids
+      tags: List[String]
+    Output:
+      predictions: List[String]
+    """
+    real_tags, start, transition, final, emission = get_decoding_tables(model, tags)
+    N = len(observation)
+    if N == 0:
+        return []
+
+    emissions = emission_scores(emission, encode_observation(model, observation))
+    backpointer = np.zeros((N, len(real_tags)), dtype=int)
+
+    dp = start + emissions[0]
+    for i in range(1, N):
+        # scores[k, j] = dp[k] + (log[P(tag_j | tag_k)] + log[P(token_i | tag_j)]),
+        # summed in the same order as `viterbi` so ties break identically
+        scores = dp[:, None] + (transition + emissions[i][None, :])
+        backpointer[i] = np.argmax(scores, axis=0)
+        dp = scores[backpointer[i], np.arange(len(real_tags))]
+
+    best_path = [int(np.argmax(dp + final))]
+    for i in range(N - 1, 0, -1):
+        best_path.append(backpointer[i, best_path[-1]])
+    best_path.reverse()
+
+    return [real_tags[i] for i in best_path]
+
+
+def viterbi_batch(
+    model, observations, tags, batch_size=256, constraints=None, tag_dictionary=None
+):
+    """
+    Returns the same predicted tag sequences as calling `viterbi` on each
+    observation, but decodes `batch_size` sentences at a time. Each batch is
+    packed into a padded (B, N) token id matrix and the max-product recursion
+    runs over the whole batch at once; a length mask freezes finished sentences
+    so the 'qf' transition is applied at each sentence's real length.
+
+    Sentences are grouped by length before batching to keep padding small, and
+    the predictions are returned in the original order.
+
+    With `constraints`, only the allowed start tags and transitions are
+    considered, each step relaxing over the allowed predecessors of every tag
+    only; the result is the best path that satisfies them (see
+    `TransitionConstraints`).
+
+    With `tag_dictionary` (models.TagDictionary), each token may only take one
+    of its candidate tags: the result is the best path over those, the same as
+    decoding with the other tags' emission scores set to -inf. This is an output
+    restriction, not pruning: every step still scores all K^2 tag pairs, which
+    with K = 9 costs less than selecting the candidate pairs of each sentence.
+
+    Input:
+      model: HMM model
+      observations: List[List[String]], List[np.ndarray] of token ids or corpus.Corpus
+      tags: List[String]
+      batch_size: Int, number of sentences decoded together
+      constraints: TransitionConstraints over `tags`, or None
+      tag_dictionary: models.TagDictionary, or None
+    Output:
+      predictions: List[List[String]]
+    """
+    if hasattr(observations, "offsets"):
+        observations = encode_corpus(model, observations)
+    real_tags, start, transition, final, emission = get_decoding_tables(model, tags)
+    if constraints is not None:
+        if constraints.tags != real_tags:
+            raise ValueError("constraints were built for different tags")
+        start = np.where(constraints.allowed_start, start, -np.inf)
+    predictions = [[] for _ in observations]
+    order = sorted(range(len(observations)), key=lambda b: len(observations[b]))
+    order = [b for b in order if len(observations[b]) > 0]
+
+    candidates = None
+    if tag_dictionary is not None:
+        candidates = candidate_table(model, tags, tag_dictionary)
+
+    for batch, lengths, emissions, mask in decoding_batches(
+        model, observations, emission, batch_size, order, candidates
+    ):
+        B, N, K = len(batch), lengths.max(), len(real_tags)
+        rows = np.arange(B)[:, None]
+        cols = np.arange(K)[None, :]
+        backpointer = np.zeros((B, N, K), dtype=int)
+        dp = start[None, :] + emissions[:, 0]
+        for i in range(1, N):
+            if constraints is not None:
+                step, backpointer[:, i] = constraints.step(dp, transition, emissions[:, i])
+            else:
+                scores = dp[:, :, None] + (transition[None] + emissions[:, i, None, :])
+                backpointer[:, i] = np.argmax(scores, axis=1)
+                step = scores[rows, backpointer[:, i], cols]
+            dp = np.where(mask[:, i, None], step, dp)
+
+        # dp now holds each sentence's scores at its own last token
+        current = np.argmax(dp + final[None, :], axis=1)
+        paths = np.zeros((B, N), dtype=int)
+        for i in range(N - 1, -1, -1):
+            paths[:, i] = current
+            if i > 0:
+                previous = backpointer[np.arange(B), i, current]
+                current = np.where(mask[:, i], previous, current)
+
+        for row, b in enumerate(batch):
+            predictions[b] = [real_tags[j] for j in paths[row, : lengths[row]]]
+
+    return predictions
+
+
+class TransitionConstraints:
+    """
+    The tag transitions a decoder may use, stored sparsely as the list of
+    allowed (previous tag, tag) edges grouped by tag, so a decoding step only
+    scores those edges instead of all K^2 pairs. Decoding with constraints built
+    by `from_validator(tags, validate_ner_sequence)` only produces BIO-valid
+    sequences (as long as some valid sequence has a finite score).
+
+    from data_exploration import validate_ner_sequence
+    constraints = TransitionConstraints.from_validator(tags, validate_ner_sequence)
+    predictions = viterbi_batch(model, observations, tags, constraints=constraints)
+    """
+
+    def __init__(self, tags, allowed_start, allowed):
+        """
+        Input:
+          tags: List[String], tags in decoder order ('qf' is left out)
+          allowed_start: np.ndarray[bool] of shape (K,), tags that may start a sentence
+          allowed: np.ndarray[bool] of shape (K, K), whether tag k may be followed by tag j at [k, j]
+        """
+        self.tags = [t for t in tags if t != "qf"]
+        self.allowed_start = np.asarray(allowed_start, dtype=bool)
+        self.allowed = np.asarray(allowed, dtype=bool)
+        # edges sorted by tag, then by previous tag so ties break as in `viterbi`
+        self.targets_of_edges, self.sources = np.nonzero(self.allowed.T)
+        self.targets, self.group_starts = np.unique(self.targets_of_edges, return_index=True)
+        self.group_sizes = np.diff(np.append(self.group_starts, len(self.sources)))
+
+    @classmethod
+    def from_validator(cls, tags, is_valid):
+        """
+        Returns the constraints implied by a sequence validator such as
+        data_exploration.validate_ner_sequence: a tag may start a sentence if it
+        is valid on its own, and tag k may be followed by tag j if appending j to a
+        valid sequence ending in k keeps it valid.
+
+        Input:
+          tags: List[String]
+          is_valid: (List[String]) -> Boolean
+        Output:
+          constraints: TransitionConstraints
+        """
+        real_tags = [t for t in tags if t != "qf"]
+        allowed_start = np.array([is_valid([tag]) for tag in real_tags], dtype=bool)
+        allowed = np.zeros((len(real_tags), len(real_tags)), dtype=bool)
+        for k, previous in enumerate(real_tags):
+            # a shortest valid sequence ending in `previous`, if there is one
+            candidates = [[previous]] + [[first, previous] for first in real_tags]
+            prefix = next((c for c in candidates if is_valid(c)), None)
+            if prefix is None:
+                continue
+            for j, tag in enumerate(real_tags):
+                allowed[k, j] = is_valid(prefix + [tag])
+        return cls(real_tags, allowed_start, allowed)
+
+    @property
+    def num_edges(self):
+        return len(self.sources)
+
+    def step(self, dp, transition, emissions):
+        """
+        One constrained Viterbi step for a batch: returns the best score of every
+        tag over its allowed predecessors and the predecessor achieving it (the
+        first one on ties), with -inf and 0 for tags without any.
+
+        Input:
+          dp: np.ndarray of shape (B, K), scores at the previous position
+          transition: np.ndarray of shape (K, K)
+          emissions: np.ndarray of shape (B, K), emission scores at this position
+        Output:
+          step: np.ndarray of shape (B, K)
+          backpointer: np.ndarray[int] of shape (B, K)
+        """
+        sources, targets = self.sources, self.targets_of_edges
+        scores = dp[:, sources] + (transition[sources, targets] + emissions[:, targets])
+        best = np.maximum.reduceat(scores, self.group_starts, axis=1)
+        is_best = scores == np.repeat(best, self.group_sizes, axis=1)
+        first = np.minimum.reduceat(
+            np.where(is_best, np.arange(len(sources)), len(sources)), self.group_starts, axis=1
+        )
+        step = np.full(dp.shape, -np.inf)
+        step[:, self.targets] = best
+        backpointer = np.zeros(dp.shape, dtype=int)
+        backpointer[:, self.targets] = sources[np.minimum(first, len(sources) - 1)]
+        return step, backpointer
+
+
+def viterbi_constrained(model, observation, tags, constraints):
+    """
+    Returns the best tag sequence for one observation that only uses the start
+    tags and transitions allowed by `constraints`; see `viterbi_batch`.
+
+    Input:
+      model: HMM model
+      observation: List[String] or np.ndarray of token ids
+      tags: List[String]
+      constraints: TransitionConstraints
+    Output:
+      predictions: List[String]
+    """
+    return viterbi_batch(model, [observation], tags, constraints=constraints)[0]
+
+
+def _top_states(scores, width):
+    """
+    Returns the ids of the `width` best states of each row of `scores` (B, K),
+    ties going to the lower id, sorted by id so that predecessors are always
+    compared in tag order, as in `viterbi`.
+    """
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :width]
+    return np.sort(order, axis=1)
+
+
+def viterbi_beam_batch(model, observations, tags, beam_width, batch_size=256):
+    """
+    Beam search version of `viterbi_batch`: at every position only the
+    `beam_width` best states are kept, and the next position only extends those,
+    so a step costs O(beam_width * K) instead of O(K^2). The result is the best
+    path among those the beam keeps, which is the exact Viterbi path whenever it
+    never falls out of the beam; with beam_width >= K it is always identical to
+    `viterbi`.
+
+    Input:
+      model: HMM model
+      observations: List[List[String]], List[np.ndarray] of token ids or corpus.Corpus
+      tags: List[String]
+      beam_width: Int, number of states kept per position
+      batch_size: Int, number of sentences decoded together
+    Output:
+      predictions: List[List[String]]
+    """
+    if hasattr(observations, "offsets"):
+        observations = encode_corpus(model, observations)
+    real_tags, start, transition, final, emission = get_decoding_tables(model, tags)
+    K = len(real_tags)
+    W = max(1, min(beam_width, K))
+    predictions = [[] for _ in observations]
+
+    for batch, lengths, emissions, mask in decoding_batches(model, observations, emission, batch_size):
+        B, N = len(batch), lengths.max()
+
+        # beams[:, i] holds the state ids kept at position i (sorted), and
+        # backpointer[:, i] the previous state of each of them
+        beams = np.zeros((B, N, W), dtype=int)
+        backpointer = np.zeros((B, N, W), dtype=int)
+        scores = start[None, :] + emissions[:, 0]
+        beam = _top_states(scores, W)
+        dp = np.take_along_axis(scores, beam, axis=1)
+        beams[:, 0] = beam
+        for i in range(1, N):
+            # scores[b, w, j] = dp[b, w] + (log[P(tag_j | beam state w)] + log[P(token_i | tag_j)])
+            scores = dp[:, :, None] + (transition[beam] + emissions[:, i, None, :])
+            best = np.argmax(scores, axis=1)
+            step = np.take_along_axis(scores, best[:, None, :], axis=1)[:, 0]
+            next_beam = _top_states(step, W)
+            previous = np.take_along_axis(beam, np.take_along_axis(best, next_beam, axis=1), axis=1)
+            active = mask[:, i, None]
+            beam = np.where(active, next_beam, beam)
+            dp = np.where(active, np.take_along_axis(step, next_beam, axis=1), dp)
+            beams[:, i] = beam
+            backpointer[:, i] = previous
+
+        rows = np.arange(B)
+        position = np.argmax(dp + final[beam], axis=1)
+        current = beam[rows, position]
+        paths = np.zeros((B, N), dtype=int)
+        for i in range(N - 1, -1, -1):
+            paths[:, i] = current
+            if i > 0:
+                previous = backpointer[rows, i, position]
+                previous_position = np.argmax(beams[:, i - 1] == previous[:, None], axis=1)
+                current = np.where(mask[:, i], previous, current)
+                position = np.where(mask[:, i], previous_position, position)
+
+        for row, b in enumerate(batch):
+            predictions[b] = [real_tags[j] for j in paths[row, : lengths[row]]]
+
+    return predictions
+
+
+def viterbi_beam(model, observation, tags, beam_width):
+    """
+    Returns the predicted tag sequence for one observation using beam search
+    with `beam_width` states per position; see `viterbi_beam_batch`.
+
+    Input:
+      model: HMM model
+      observation: List[String] or np.ndarray of token ids
+      tags: List[String]
+      beam_width: Int
+    Output:
+      predictions: List[String]
+    """
+    return viterbi_beam_batch(model, [observation], tags, beam_width)[0]
+
+
+def _top_hypotheses(scores, k):
+    """
+    Returns the positions of the `k` best entries along axis 1 of `scores` and
+    their values, best first. The k best are selected with a partition and only
+    they are sorted, ties going to the lower position; with k = 1 this is the
+    first maximum, as in `viterbi`.
+    """
+    if k == 1:
+        order = np.argmax(scores, axis=1)[:, None]
+    elif k < scores.shape[1]:
+        order = np.sort(np.argpartition(-scores, k - 1, axis=1)[:, :k], axis=1)
+        order = np.take_along_axis(
+            order, np.argsort(-np.take_along_axis(scores, order, axis=1), axis=1, kind="stable"), axis=1
+        )
+    else:
+        order = np.argsort(-scores, axis=1, kind="stable")
+    return order, np.take_along_axis(scores, order, axis=1)
+
+
+def viterbi_kbest_batch(model, observations, tags, k, batch_size=256):
+    """
+    Returns the `k` best tag sequences of every observation with their scores,
+    decoding `batch_size` sentences at a time like `viterbi_batch`.
+
+    Every state keeps its k best partial hypotheses, sorted by score, with a
+    backpointer to the previous state and that state's hypothesis rank. A step
+    merges, for each state, the K sorted lists of its predecessors extended by
+    one transition and keeps the k best of the K * k candidates, so the
+    recursion costs O(N * K^2 * k + N * K * k * log(k)) instead of re-decoding with
+    exclusions. The end of every sentence applies the transition into 'qf' to
+    all K * k final hypotheses before the k best are traced back. With k = 1
+    the result is the same as `viterbi`.
+
+    Input:
+      model: HMM model
+      observations: List[List[String]], List[np.ndarray] of token ids or corpus.Corpus
+      tags: List[String]
+      k: Int, number of sequences per observation
+      batch_size: Int, number of sentences decoded together
+    Output:
+      sequences: List[List[List[String]]], up to k tag sequences per observation,
+        best first (fewer when the sentence has fewer than k possible sequences)
+      scores: List[np.ndarray], the log joint probability of each sequence
+    """
+    if hasattr(observations, "offsets"):
+        observations = encode_corpus(model, observations)
+    real_tags, start, transition, final, emission = get_decoding_tables(model, tags)
+    K = len(real_tags)
+    k = max(1, k)
+    sequences = [[[]] for _ in observations]
+    scores = [np.zeros(1) for _ in observations]
+
+    for batch, lengths, emissions, mask in decoding_batches(model, observations, emission, batch_size):
+        B, N = len(batch), lengths.max()
+
+        # dp[b, j, r] is the score of the r-th best hypothesis ending in tag j,
+        # and backpointer[b, i, j, r] its index p * k + s in the (K, k) hypotheses
+        # of position i - 1 (previous tag p, rank s); missing ranks are -inf
+        dp = np.full((B, K, k), -np.inf)
+        dp[:, :, 0] = start[None, :] + emissions[:, 0]
+        backpointer = np.zeros((B, N, K, k), dtype=int)
+        for i in range(1, N):
+            # candidates[b, p * k + s, j] = dp[b, p, s] + (transition[p, j] + emission[j, token_i])
+            candidates = dp[:, :, :, None] + (transition[None, :, None, :] + emissions[:, i, None, None, :])
+            best, step = _top_hypotheses(candidates.reshape(B, K * k, K), k)
+            active = mask[:, i, None, None]
+            dp = np.where(active, step.transpose(0, 2, 1), dp)
+            backpointer[:, i] = best.transpose(0, 2, 1)
+
+        # ends[b, j * k + r] = dp[b, j, r] + log[P(qf | tag_j)]
+        ends, totals = _top_hypotheses((dp + final[None, :, None]).reshape(B, K * k), k)
+        rows = np.arange(B)[:, None]
+        current = ends
+        paths = np.zeros((B, N, k), dtype=int)
+        for i in range(N - 1, -1, -1):
+            paths[:, i] = current // k
+            if i > 0:
+                previous = backpointer[rows, i, current // k, current % k]
+                current = np.where(mask[:, i, None], previous, current)
+
+        for row, b in enumerate(batch):
+            found = np.isfinite(totals[row])
+            sequences[b] = [
+                [real_tags[j] for j in paths[row, : lengths[row], r]]
+                for r in np.flatnonzero(found)
+            ]
+            scores[b] = totals[row][found]
+
+    return sequences, scores
+
+
+def viterbi_kbest(model, observation, tags, k):
+    """
+    Returns the `k` best tag sequences for one observation and their scores; see
+    `viterbi_kbest_batch`.
+
+    Input:
+      model: HMM model
+      observation: List[String] or np.ndarray of token ids
+      tags: List[String]
+      k: Int
+    Output:
+      sequences: List[List[String]], best first
+      scores: np.ndarray of shape (len(sequences),)
+    """
+    sequences, scores = viterbi_kbest_batch(model, [observation], tags, k)
+    return sequences[0], scores[0]